@@ -1,12 +1,14 @@
 from lib import status_manager as sm
+from lib import status_watcher as sw
+from lib import status_delta as sd
 from lib import file_manager as fm
 from lib import log_manager as lm
 from lib import cam_manager as cam
 from lib import aws
-import json, time, datetime, threading, os, sys
+import json, time, datetime, threading, os, sys, multiprocessing
 
 class AWSClient: 
-    def __init__(self, device_type, device_number, data_folder, recipe_folder, setting_folder, log_folder, history_folder, cam_folder, iotcore_endpoint, iotcore_clientid, iotcore_topic, iotcore_cacert, iotcore_certfile, iotcore_privatekey, apig_endpoint):
+    def __init__(self, device_type, device_number, data_folder, recipe_folder, setting_folder, log_folder, history_folder, cam_folder, iotcore_endpoint, iotcore_clientid, iotcore_topic, iotcore_cacert, iotcore_certfile, iotcore_privatekey, apig_endpoint, status_delta=False, keyframe_interval=30, log_config=None, analysis_config=None, cam_config=None):
         self.iot_core = aws.ToIoTCore(endpoint=iotcore_endpoint, client_id=iotcore_clientid, topic=iotcore_topic, ca_cert=iotcore_cacert, cert_file=iotcore_certfile, private_key=iotcore_privatekey)
         self.iot_core.set_onmessage(self.iotcore_onmessage_handler)
         
@@ -15,9 +17,15 @@ class AWSClient:
         self.api_gateway = aws.ToAPIG(endpoint=apig_endpoint)
 
         self.client_status = sm.StatusManager(device_type=device_type, device_number=device_number, history_folder=history_folder)
-        self.client_file = fm.FileManager(device_type=device_type, device_number=device_number, data_folder=data_folder, recipe_folder=recipe_folder, setting_folder=setting_folder, log_folder=log_folder, history_folder=history_folder, cam_folder=cam_folder)
-        self.client_log = lm.LogManager(device_type=device_type, device_number=device_number, log_folder=log_folder)
-        self.client_cam = cam.CamManager(camera_index=0, width=1280, height=720, fps=30, webp_quality=50, cam_folder=cam_folder)
+        self.status_watcher = sw.StatusWatcher(status_manager=self.client_status)
+        self.status_encoder = sd.StatusDeltaEncoder(keyframe_interval=keyframe_interval) if status_delta else None
+        # Set when a browser asks for the full status; status_handler then publishes even if nothing changed
+        self.status_refresh = threading.Event()
+        analysis_config = analysis_config or {}
+        self.client_file = fm.FileManager(device_type=device_type, device_number=device_number, data_folder=data_folder, recipe_folder=recipe_folder, setting_folder=setting_folder, log_folder=log_folder, history_folder=history_folder, cam_folder=cam_folder, analysis_workers=analysis_config.get("workers"), history_blob=analysis_config.get("blob", "summary"), small_blob=analysis_config.get("small_blob", fm.img_process.SMALL_BLOB_PIXELS), container_compression=analysis_config.get("container_compression", "zlib"), idx_verify=analysis_config.get("idx_verify", 3), analysis_memory_budget=analysis_config.get("memory_budget"))
+        self.client_log = lm.LogManager(device_type=device_type, device_number=device_number, log_folder=log_folder, **(log_config or {}))
+        cam_config = cam_config or {}
+        self.client_cam = cam.CamManager(camera_index=0, width=1280, height=720, fps=30, webp_quality=50, cam_folder=cam_folder, motion_threshold=cam_config.get("motion_threshold"), motion_max_gap=cam_config.get("max_gap", 30), capture_fps=cam_config.get("capture_fps"), buffer_frames=cam_config.get("buffer_frames", 4), renditions=cam_config.get("renditions"), backend=cam_config.get("backend", "auto"), backend_options=cam_config.get("backend_options"), passthrough=cam_config.get("passthrough", False), store_budget=cam_config.get("store_budget"))
         
     def request_file_transfer(self, ftype, fname, fcontent):
         if ftype == "data":
@@ -163,6 +171,11 @@ class AWSClient:
             data = message.get("data")
             self.request_change_file(type="print-recipe", name=data.get("name"), content=data.get("content"))
             
+        elif request == "status-keyframe":
+            if self.status_encoder is not None:
+                self.status_encoder.request_keyframe()
+            self.status_refresh.set()
+        
         elif request == "change-setting":
             # print("=========================================================\n=========================================================\nDEVICE REQUEST: CHANGE SETTING!!!!\n=========================================================\n=========================================================\n")
             data = message.get("data")
@@ -204,23 +217,54 @@ PRIVATE_KEY = client_config["IoTCore"]["private_key"]
 
 APIG_ENDPOINT = client_config["APIGateway"]["end_point"]  
 
+STATUS_DELTA = client_config.get("status", {}).get("delta", False)
+KEYFRAME_INTERVAL = client_config.get("status", {}).get("keyframe_interval", 30)
+
+# LogManager rotation / fsync policy (max_entries, max_bytes, max_age, sync_entries, sync_interval, segment)
+LOG_CONFIG = client_config.get("log", {})
+# Upload rotated segments as stored (.seg.gz / .seg.xz, "device-log-segment") instead of the {"device", "data"} document;
+# only for servers that unpack them
+UPLOAD_LOG_SEGMENT = client_config.get("upload", {}).get("log_segment", False)
+
+# Slice analysis for print history (workers, blob: raw/summary/total/binary, small_blob, container_compression, idx_verify, memory_budget)
+ANALYSIS_CONFIG = client_config.get("analysis", {})
+
+# Camera (motion_threshold: skip saved frames closer than this to the last saved one, max_gap: seconds,
+# capture_fps / buffer_frames: background capture into a small ring buffer, null captures on demand,
+# renditions: {"archive"|"live": {"width", "quality"}} overrides for the saved and the published encoding,
+# backend: auto/picamera2/legacy/opencv/synthetic/replay with backend_options, e.g. {"folder": ..., "fps": 10} for replay,
+# passthrough: store/publish the camera's own JPEG frames where no resize is needed,
+# store_budget: bytes of saved frames kept in the cam folder, older frames are thinned beyond it)
+CAM_CONFIG = client_config.get("camera", {})
+
 CAPTURE_INTERVAL = 10
 SAVE_INTERVAL = 1
+# all-status goes out on change, never more often than this (seconds), and never without a change except for storage
+STATUS_PUBLISH_INTERVAL = 1
+# After a status file event, wait this long for the writes that come with it before taking the snapshot
+STATUS_SETTLE = 0.05
 
 
-def control_print_history(client_status: sm.StatusManager):
-    if client_status.get_device_status()["status"] in ["PRINTING_READY", "PRINTING", "PRINTING_PAUSE", "PARTS_REMOVING", "WAIT_POSTPROCESS", "PUSH_PARTS"]:
+def control_print_history(client_status: sm.StatusManager, snapshot: dict = None):
+    if snapshot is None:
+        snapshot = client_status.get_status_snapshot()
+    device_status = snapshot["device"]["status"]
+    
+    if device_status in ["PRINTING_READY", "PRINTING", "PRINTING_PAUSE", "PARTS_REMOVING", "WAIT_POSTPROCESS", "PUSH_PARTS"]:
         if os.path.exists(get_resource_path("print-history.json")) == False:
+            print_status = snapshot["print"]
+            sensor_status = snapshot["sensor"]
+            
             client_status.create_print_history()
             current_history = client_status.get_print_history()
             current_history["name"] = f'{DEVICE_TYPE}-{DEVICE_NUMBER}-{int(time.time())}'
-            current_history["database"]["user"] = client_status.get_print_status()["user"]
-            current_history["database"]["print"]["data"] = client_status.get_print_status()["data"][client_status.get_print_status()["data-index"]]
-            current_history["database"]["print"]["recipe"] = client_status.get_print_status()["recipe"]
+            current_history["database"]["user"] = print_status["user"]
+            current_history["database"]["print"]["data"] = print_status["data"][print_status["data-index"]]
+            current_history["database"]["print"]["recipe"] = print_status["recipe"]
             current_history["database"]["time"]["start"] = datetime.datetime.fromtimestamp(int(time.time())).strftime("%Y:%m:%d:%H:%M:%S")
 
-            current = float(client_status.get_sensor_status()["temperature"]["current"])
-            target = float(client_status.get_sensor_status()["temperature"]["target"])
+            current = float(sensor_status["temperature"]["current"])
+            target = float(sensor_status["temperature"]["target"])
             if current - target > 1 or target - current > 1:
                 current_history["database"]["warning"] = f"HEATING: {target - current:.2f} DEGREE DIFFERENCE"
     
@@ -228,11 +272,11 @@ def control_print_history(client_status: sm.StatusManager):
         
         return False, None
     
-    elif client_status.get_device_status()["status"] in ["PRINTING_ABORT", "PRINTING_FINISH"]:
+    elif device_status in ["PRINTING_ABORT", "PRINTING_FINISH"]:
         if os.path.exists(get_resource_path("print-history.json")):
             current_history = client_status.get_print_history()
             if current_history["database"]["result"] == "-":
-                current_history["database"]["result"] = client_status.get_device_status()["status"]
+                current_history["database"]["result"] = device_status
                 current_history["database"]["time"]["end"] = datetime.datetime.fromtimestamp(int(time.time())).strftime("%Y:%m:%d:%H:%M:%S")
 
                 with open(os.path.join(client_status.history_folder, f'{current_history["name"]}.json'), 'w', encoding='utf-8') as f:
@@ -253,23 +297,21 @@ def control_print_history(client_status: sm.StatusManager):
         else:
             return False, None
         
-    elif client_status.get_device_status()["status"] in ["OFFLINE", "IDLE", "CONFIG_EDIT", "DEVICE_CONTROL"]:
+    elif device_status in ["OFFLINE", "IDLE", "CONFIG_EDIT", "DEVICE_CONTROL"]:
         if os.path.exists(get_resource_path("print-history.json")):
             client_status.delete_print_history()
-            print(f"\n=========================================================\n=========================================================\nDELETE PRINT HISTORY DUE TO DEVICE: {client_status.get_device_status()['status']}\n=========================================================\n=========================================================\n")
+            print(f"\n=========================================================\n=========================================================\nDELETE PRINT HISTORY DUE TO DEVICE: {device_status}\n=========================================================\n=========================================================\n")
         return False, None
     
     else:
-        print(f"\n=========================================================\n=========================================================\nINVALID STATUS: {client_status.get_device_status()['status']}\n=========================================================\n=========================================================\n")
+        print(f"\n=========================================================\n=========================================================\nINVALID STATUS: {device_status}\n=========================================================\n=========================================================\n")
         return False, None
 
 def captureimg_handler(apig_client: aws.ToAPIG, client_file: fm.FileManager, folder:str):
     try:
         if client_file.get_frame_count(folder=folder)[1] > 0:
-            valid, zip_path = client_file.get_preview_zip(folder=folder)
+            valid, zip_data = client_file.get_preview_zip(folder=folder)
             if valid == True:
-                with open(zip_path, "rb") as zip_file:
-                    zip_data = zip_file.read()
                 apig_client.put_data_to_s3(
                     put_url=apig_client.get_presigned_url(devtype=DEVICE_TYPE, devnum=DEVICE_NUMBER, method="put_object", data="preview-zip", name=folder)["data"]["url"],
                     data=zip_data
@@ -299,17 +341,28 @@ def captureimg_handler(apig_client: aws.ToAPIG, client_file: fm.FileManager, fol
         print(f"Exception in captureimg_handler: {str(e)}")
         pass
         
-def cam_handler(cam_client: aws.ToIoTCore, client_status: sm.StatusManager, client_cam: cam.CamManager):
+def cam_handler(cam_client: aws.ToIoTCore, client_status: sm.StatusManager, client_cam: cam.CamManager, status_watcher: sw.StatusWatcher = None):
     delay_time = CAPTURE_INTERVAL
+    status_events = status_watcher.subscribe(files=["device-status.json"]) if status_watcher is not None else None
+    timelapse_folder = None
     while True:
         try:
-            if client_status.get_device_status()['status'] == "PRINTING" and client_status.get_print_history() is not None:
-                if client_cam.exists_cam_folder(sub_folder=f"{client_status.get_print_history()['name']}") == False:
-                    client_cam.create_sub_folder(sub_folder=f"{client_status.get_print_history()['name']}")
-                encoded_image = client_cam.save_image(sub_folder=f"{client_status.get_print_history()['name']}")
+            device_status = client_status.get_device_status()['status']
+            print_history = client_status.get_print_history() if device_status == "PRINTING" else None
+            if timelapse_folder is not None and (device_status in ["PRINTING_ABORT", "PRINTING_FINISH"] or (print_history is not None and print_history['name'] != timelapse_folder)):
+                # Print ended (not paused): close the timelapse now so the video is ready when the history is uploaded.
+                # The merge runs on its own thread so the camera keeps publishing; the upload waits for it on the writer lock
+                threading.Thread(target=client_cam.finish_timelapse, args=(timelapse_folder,)).start()
+                timelapse_folder = None
+                
+            if device_status == "PRINTING" and print_history is not None:
+                if client_cam.exists_cam_folder(sub_folder=f"{print_history['name']}") == False:
+                    client_cam.create_sub_folder(sub_folder=f"{print_history['name']}")
+                encoded_image = client_cam.save_image(sub_folder=f"{print_history['name']}")
+                timelapse_folder = print_history['name']
                 delay_time = SAVE_INTERVAL
                 
-            elif client_status.get_device_status()['status'] == "OFFLINE": 
+            elif device_status == "OFFLINE": 
                 encoded_image = None
                 delay_time = CAPTURE_INTERVAL
             
@@ -325,52 +378,111 @@ def cam_handler(cam_client: aws.ToIoTCore, client_status: sm.StatusManager, clie
                         "number": DEVICE_NUMBER
                     },
                     "data": {
-                        "encoded": encoded_image
+                        "encoded": encoded_image,
+                        "format": client_cam.live_format,
+                        "capture": client_cam.get_capture_stats(),
+                        "renditions": client_cam.get_rendition_stats(),
+                        # Saved frame usage of the cam folder against its budget
+                        "storage": client_cam.get_storage_usage()
                     }
                     
                 }
             )
             
-            time.sleep(delay_time)
+            if status_events is None:
+                time.sleep(delay_time)
+                continue
+            
+            # Sleep for delay_time, but react at once when the device status itself changes
+            deadline = time.monotonic() + delay_time
+            while time.monotonic() < deadline:
+                if status_events.wait(timeout=deadline - time.monotonic()) and client_status.get_device_status()['status'] != device_status:
+                    break
         except Exception as e:
             print(f"Exception in cam_handler: {str(e)}")
             pass
 
-def status_handler(iot_client: aws.ToIoTCore, client_status: sm.StatusManager, client_log: lm.LogManager):
+def publish_status(iot_client: aws.ToIoTCore, status_target: list, snapshot: dict, status_encoder: sd.StatusDeltaEncoder = None):
+    if status_encoder is None:
+        iot_client.publish({
+                "target": status_target,
+                "action": "all-status",
+                "device": {
+                    "type": DEVICE_TYPE,
+                    "number": DEVICE_NUMBER
+                },
+                "data": snapshot
+            }
+        )
+        return
+    
+    # Storage always receives a full document; the browser gets keyframes and in-between patches
+    kind, seq, payload = status_encoder.encode(snapshot, force_keyframe="storage" in status_target)
+    if kind == "keyframe":
+        iot_client.publish({
+                "target": status_target,
+                "action": "all-status",
+                "device": {
+                    "type": DEVICE_TYPE,
+                    "number": DEVICE_NUMBER
+                },
+                "seq": seq,
+                "data": payload
+            }
+        )
+    elif kind == "delta":
+        iot_client.publish({
+                "target": status_target,
+                "action": "all-status-delta",
+                "device": {
+                    "type": DEVICE_TYPE,
+                    "number": DEVICE_NUMBER
+                },
+                "seq": seq,
+                "data": payload
+            }
+        )
+
+def status_handler(iot_client: aws.ToIoTCore, client_status: sm.StatusManager, client_log: lm.LogManager, status_watcher: sw.StatusWatcher = None, status_encoder: sd.StatusDeltaEncoder = None, status_refresh: threading.Event = None):
     count = 0
     current_timestamp = int(time.time())
     
     current_devconfig = dict()
 
-    file_path = client_log.create_log_file()
-    log_count = 0
+    status_events = status_watcher.subscribe() if status_watcher is not None else None
+    next_tick = time.monotonic()
+    last_snapshot = None
+    last_publish = None
     while True:
         try:
-            status_target = ["browser"]
-                     
-            if count >= 60 or int(time.time()) - current_timestamp >= 60: 
-                status_target.append("storage")
-                count = 0
-                current_timestamp = int(time.time())
-            elif client_status.get_device_status()['status'] == "OFFLINE":
-                status_target.append("storage")
-                
-            iot_client.publish({
-                    "target": status_target,
-                    "action": "all-status",
-                    "device": {
-                        "type": DEVICE_TYPE,
-                        "number": DEVICE_NUMBER
-                    },
-                    "data": {
-                        "device": client_status.get_device_status(),
-                        "sensor": client_status.get_sensor_status(),
-                        "print": client_status.get_print_status()
-                    }
-                }
-            )
+            # Logging and storage counters run on the 1-second tick. all-status is published only when the snapshot
+            # changed (or storage is due), at most once per STATUS_PUBLISH_INTERVAL: a change right after a publish
+            # waits for the interval and goes out merged with whatever else changed meanwhile.
+            now = time.monotonic()
+            is_tick = now >= next_tick
+            if is_tick: 
+                next_tick = now + 1
             
-            valid, data = control_print_history(client_status=client_status)
+            snapshot = client_status.get_status_snapshot()
+            storage_due = count >= 60 or int(time.time()) - current_timestamp >= 60
+            refresh = status_refresh is not None and status_refresh.is_set()
+            pending = snapshot != last_snapshot or storage_due or refresh
+            if pending and (last_publish is None or now - last_publish >= STATUS_PUBLISH_INTERVAL):
+                status_target = ["browser"]
+                if storage_due: 
+                    status_target.append("storage")
+                    count = 0
+                    current_timestamp = int(time.time())
+                elif snapshot["device"]['status'] == "OFFLINE":
+                    status_target.append("storage")
+                    
+                if refresh: status_refresh.clear()
+                publish_status(iot_client=iot_client, status_target=status_target, snapshot=snapshot, status_encoder=status_encoder)
+                last_snapshot = snapshot
+                last_publish = now
+                pending = False
+            
+            valid, data = control_print_history(client_status=client_status, snapshot=snapshot)
             if valid == True:
                 print(f"NEW PRINT HISTORY: {data}")
                 iot_client.publish({
@@ -387,29 +499,14 @@ def status_handler(iot_client: aws.ToIoTCore, client_status: sm.StatusManager, c
                     }
                 )
             
-            if log_count < 3600:
-                
-                client_log.update_log_file(file=file_path,data={
+            if is_tick:
+                client_log.append_log(data={
                     "timestamp": int(time.time()),
-                    "device": aws_client.client_status.get_device_status(),
-                    "sensor": aws_client.client_status.get_sensor_status(),
-                    "print": aws_client.client_status.get_print_status()
-                })    
-                log_count += 1        
-            else:  
-                log_count = 0
-                print("=========================================================\n=========================================================\nDEVICE LOG: SAVE AND UPDATE!!!!\n=========================================================\n=========================================================\n")
-                client_log.save_log_file(file=file_path)
-                file_path = client_log.create_log_file()
-                client_log.update_log_file(file=file_path,data={
-                    "timestamp": int(time.time()),
-                    "device": client_status.get_device_status(),
-                    "sensor": client_status.get_sensor_status(),
-                    "print": client_status.get_print_status()
+                    **snapshot
                 })
-                # log_count = 0
             
-            if client_status.get_device_alarm()["subject"] != "-":
+            device_alarm = client_status.get_device_alarm()
+            if device_alarm["subject"] != "-":
                 iot_client.publish({
                         "target": ["browser", "storage"],
                         "action": "device-alarm",
@@ -417,14 +514,15 @@ def status_handler(iot_client: aws.ToIoTCore, client_status: sm.StatusManager, c
                             "type": DEVICE_TYPE,
                             "number": DEVICE_NUMBER
                         },
-                        "data": client_status.get_device_alarm() 
+                        "data": device_alarm
                     }
                 )
                 
                 client_status.set_device_alarm(client_status.device_alarm)
                 
-            if current_devconfig != client_status.get_device_config():
-                current_devconfig = client_status.get_device_config()
+            device_config = client_status.get_device_config()
+            if current_devconfig != device_config:
+                current_devconfig = device_config
                 iot_client.publish({
                         "target": ["browser", "storage"],
                         "action": "device-config",
@@ -432,65 +530,94 @@ def status_handler(iot_client: aws.ToIoTCore, client_status: sm.StatusManager, c
                             "type": DEVICE_TYPE,
                             "number": DEVICE_NUMBER
                         },
-                        "data": client_status.get_device_config() 
+                        "data": device_config
                     }
                 )    
             
-            time.sleep(1)
+            if is_tick:
+                count += 1
             
-            count += 1
+            wake = min(next_tick, last_publish + STATUS_PUBLISH_INTERVAL) if pending else next_tick
+            remaining = wake - time.monotonic()
+            if remaining > 0:
+                if status_events is not None:
+                    if status_events.wait(timeout=remaining):
+                        # device-status and print-status are often written together: take both in one snapshot
+                        time.sleep(STATUS_SETTLE)
+                else:
+                    time.sleep(remaining)
         except Exception as e:
             print(f"Exception in status_handler: {str(e)}")
             pass
 
+def get_put_url(apig_client: aws.ToAPIG, data: str, name=None):
+    # None when the API gives no URL, e.g. for an opt-in kind the server does not know yet
+    response = apig_client.get_presigned_url(devtype=DEVICE_TYPE, devnum=DEVICE_NUMBER, method="put_object", data=data, name=name)
+    if response is None:
+        print(f"No presigned URL for {data}/{name}")
+        return None
+    return response["data"]["url"]
+
 def file_handler(apig_client: aws.ToAPIG, client_file: fm.FileManager):
     
     while True:
         try:
+            # Only categories with added / removed / modified entries are rebuilt and compared
+            file_events = client_file.get_file_events()
+            
             # Get Print Data
-            # print("=========================================================\n=========================================================\nCheck Data and Recipe!!!!\n=========================================================\n=========================================================\n")
-            current_data = client_file.get_print_data()
-            if client_file.print_data != current_data and current_data is not None:
-                client_file.print_data = current_data
-                # print("=========================================================\n=========================================================\nPrint Data Updated!!!!\n=========================================================\n=========================================================\n")
-                apig_client.put_file_to_s3(
-                      put_url=apig_client.get_presigned_url(devtype=DEVICE_TYPE, devnum=DEVICE_NUMBER, method="put_object", data="print-data")["data"]["url"], 
-                    data=client_file.print_data
-                )
+            if file_events["data"]:
+                current_data = client_file.get_print_data(events=file_events["data"])
+                if client_file.print_data != current_data and current_data is not None:
+                    client_file.print_data = current_data
+                    # print("=========================================================\n=========================================================\nPrint Data Updated!!!!\n=========================================================\n=========================================================\n")
+                    apig_client.put_file_to_s3(
+                          put_url=apig_client.get_presigned_url(devtype=DEVICE_TYPE, devnum=DEVICE_NUMBER, method="put_object", data="print-data")["data"]["url"], 
+                        data=client_file.print_data
+                    )
 
             # Get Print Recipe
-            valid,current_recipe = client_file.get_print_recipe()
-            if client_file.print_recipe != current_recipe and valid == True:
-                client_file.print_recipe = current_recipe
-                # print(f"CURRENT PRINT RECIPE: {client_file.print_recipe}")
-                # print("=========================================================\n=========================================================\nPrint Recipe Updated!!!!\n=========================================================\n=========================================================\n")
-                apig_client.put_file_to_s3(
-                    put_url=apig_client.get_presigned_url(devtype=DEVICE_TYPE, devnum=DEVICE_NUMBER, method="put_object", data="print-recipe")["data"]["url"],
-                    data=client_file.print_recipe
-                )
+            if file_events["recipe"]:
+                valid,current_recipe = client_file.get_print_recipe(events=file_events["recipe"])
+                if client_file.print_recipe != current_recipe and valid == True:
+                    client_file.print_recipe = current_recipe
+                    # print(f"CURRENT PRINT RECIPE: {client_file.print_recipe}")
+                    # print("=========================================================\n=========================================================\nPrint Recipe Updated!!!!\n=========================================================\n=========================================================\n")
+                    apig_client.put_file_to_s3(
+                        put_url=apig_client.get_presigned_url(devtype=DEVICE_TYPE, devnum=DEVICE_NUMBER, method="put_object", data="print-recipe")["data"]["url"],
+                        data=client_file.print_recipe
+                    )
                  
-            current_setting = client_file.get_device_setting()[1]
-            if client_file.device_setting != current_setting:
-                client_file.device_setting = current_setting 
-                # print(f"CURRENT DEVICE SETTING: {client_file.device_setting}")
-                # print("=========================================================\n=========================================================\nDEVICE SETTING Updated!!!!\n=========================================================\n=========================================================\n")
-                apig_client.put_file_to_s3(
-                    put_url=apig_client.get_presigned_url(devtype=DEVICE_TYPE, devnum=DEVICE_NUMBER, method="put_object", data="device-setting")["data"]["url"],
-                    data=client_file.device_setting
-                )
+            if file_events["setting"]:
+                valid, current_setting = client_file.get_device_setting(events=file_events["setting"])
+                if client_file.device_setting != current_setting and valid == True:
+                    client_file.device_setting = current_setting 
+                    # print(f"CURRENT DEVICE SETTING: {client_file.device_setting}")
+                    # print("=========================================================\n=========================================================\nDEVICE SETTING Updated!!!!\n=========================================================\n=========================================================\n")
+                    apig_client.put_file_to_s3(
+                        put_url=apig_client.get_presigned_url(devtype=DEVICE_TYPE, devnum=DEVICE_NUMBER, method="put_object", data="device-setting")["data"]["url"],
+                        data=client_file.device_setting
+                    )
                 
             valid, current_logs = client_file.get_device_log_updatelist()
             if valid == True:
                 for current_log in current_logs:
-                    valid, updated_log = client_file.get_device_log(current_log)
+                    valid, updated_log = client_file.get_device_log(current_log, segment=UPLOAD_LOG_SEGMENT)
                     # print(f"CURRENT DEVICE LOG: {updated_log}")
                     # print("=========================================================\n=========================================================\nDEVICE LOG Updated!!!!\n=========================================================\n=========================================================\n")
-                    if valid == True:
+                    if valid == True and isinstance(updated_log, bytes):
+                        # Opt-in: compressed columnar segment (format/version inside), uploaded without expanding it
+                        print(f"CURRENT DEVICE LOG: {current_log} ({len(updated_log)} bytes)")
+                        put_url = get_put_url(apig_client, data="device-log-segment", name=str(current_log).split('.')[0])
+                        if put_url is not None:
+                            apig_client.put_data_to_s3(put_url=put_url, data=updated_log, content_type=lm.get_segment_content_type(current_log))
+                            continue
+                        # The API does not offer the segment kind: fall back to the log document
+                        valid, updated_log = client_file.get_device_log(current_log)
+                    put_url = get_put_url(apig_client, data="device-log", name=str(current_log).split('.')[0]) if valid == True else None
+                    if put_url is not None:
                         print(f"CURRENT DEVICE LOG: {updated_log}")
-                        apig_client.put_file_to_s3(
-                            put_url=apig_client.get_presigned_url(devtype=DEVICE_TYPE, devnum=DEVICE_NUMBER, method="put_object", data="device-log", name=str(current_log).split('.')[0])["data"]["url"],
-                            data=updated_log
-                        )
+                        apig_client.put_file_to_s3(put_url=put_url, data=updated_log)
                 client_file.reset_device_log_updatelist()
                 
             valid, current_historys = client_file.get_print_history_updatelist()
@@ -504,6 +631,12 @@ def file_handler(apig_client: aws.ToAPIG, client_file: fm.FileManager):
                         put_url=apig_client.get_presigned_url(devtype=DEVICE_TYPE, devnum=DEVICE_NUMBER, method="put_object", data="print-history", name=updated_history["name"])["data"]["url"],
                         data=updated_history["storage"]
                     )
+                    slices = updated_history["storage"]["data"].get("slices")
+                    if isinstance(slices, dict) and "container" in slices:
+                        valid, container = client_file.get_print_history_slices(slices["container"])
+                        put_url = get_put_url(apig_client, data="print-history-slices", name=updated_history["name"]) if valid == True else None
+                        if put_url is not None:
+                            apig_client.put_data_to_s3(put_url=put_url, data=container)
                     threading.Thread(target=captureimg_handler, args=(apig_client, client_file, updated_history["name"])).start()
                     
                 client_file.reset_print_history_updatelist()
@@ -511,8 +644,12 @@ def file_handler(apig_client: aws.ToAPIG, client_file: fm.FileManager):
             time.sleep(1)
         except Exception as e:
             print(f"Exception in file_handler: {str(e)}")
+            # Do not rescan the folders and retry the uploads in a tight loop
+            time.sleep(1)
     
 if __name__ == "__main__":
+    # Slice analysis workers are spawned processes; required for the PyInstaller build
+    multiprocessing.freeze_support()
     aws_client = None
     try: 
         aws_client = AWSClient(
@@ -530,14 +667,20 @@ if __name__ == "__main__":
             iotcore_cacert=CA_CERT,
             iotcore_certfile=CERT_FILE,
             iotcore_privatekey=PRIVATE_KEY,
-            apig_endpoint=APIG_ENDPOINT
+            apig_endpoint=APIG_ENDPOINT,
+            status_delta=STATUS_DELTA,
+            keyframe_interval=KEYFRAME_INTERVAL,
+            log_config=LOG_CONFIG,
+            analysis_config=ANALYSIS_CONFIG,
+            cam_config=CAM_CONFIG
         )
         aws_client.iot_core.connect()
         aws_client.cam_core.connect()   
+        aws_client.status_watcher.start()
         
-        status_thread = threading.Thread(target=status_handler, args=(aws_client.iot_core, aws_client.client_status, aws_client.client_log))
+        status_thread = threading.Thread(target=status_handler, args=(aws_client.iot_core, aws_client.client_status, aws_client.client_log, aws_client.status_watcher, aws_client.status_encoder, aws_client.status_refresh))
         file_thread = threading.Thread(target=file_handler, args=(aws_client.api_gateway, aws_client.client_file))
-        cam_thread = threading.Thread(target=cam_handler, args=(aws_client.cam_core, aws_client.client_status, aws_client.client_cam))
+        cam_thread = threading.Thread(target=cam_handler, args=(aws_client.cam_core, aws_client.client_status, aws_client.client_cam, aws_client.status_watcher))
         
         status_thread.start()
         file_thread.start()
@@ -548,6 +691,8 @@ if __name__ == "__main__":
         cam_thread.join()
 
     finally:
+        aws_client.status_watcher.stop()
+        aws_client.client_log.close_log()
         aws_client.iot_core.disconnect()
         aws_client.client_status.delete_json_file()
         aws_client.cam_core.disconnect()
\ No newline at end of file
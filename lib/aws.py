@@ -98,8 +98,8 @@ class ToAPIG:
         if response.status_code == 200: return True
         else: return False
         
-    def put_data_to_s3(self, put_url, data):
-        response = requests.put(url=put_url, data=data)
+    def put_data_to_s3(self, put_url, data, content_type=None):
+        response = requests.put(url=put_url, data=data, headers={"Content-Type": content_type} if content_type is not None else None)
         if response.status_code == 200: return True
         else: return False
 
@@ -0,0 +1,243 @@
+import os, io, cv2, time
+import numpy as np
+
+# 1. 라이브러리 체크 (우선순위: Picamera2 -> Picamera -> OpenCV)
+try:
+    from picamera2 import Picamera2
+    IS_RPI_LIBCAMERA = True
+    IS_RPI_LEGACY = False
+except (ImportError, RuntimeError):
+    IS_RPI_LIBCAMERA = False
+    try:
+        import picamera
+        IS_RPI_LEGACY = True
+    except (ImportError, RuntimeError):
+        IS_RPI_LEGACY = False
+
+FRAME_FORMAT = (".jpg", ".png", ".jpeg", ".webp")
+JPEG_FORMAT = (".jpg", ".jpeg")
+JPEG_SOI = b"\xff\xd8"
+
+def decode_jpeg(data: bytes, flags=cv2.IMREAD_COLOR):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+
+def get_jpeg_size(data: bytes):
+    # (width, height) from the SOF marker, without decoding; None if not found
+    position = 2
+    while position + 9 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if 0xD0 <= marker <= 0xD9 or marker == 0x01:
+            position += 2
+            continue
+        length = int.from_bytes(data[position + 2:position + 4], "big")
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return int.from_bytes(data[position + 7:position + 9], "big"), int.from_bytes(data[position + 5:position + 7], "big")
+        position += 2 + length
+    return None
+
+class CameraBackend:
+    # read() -> BGR frame or None. grab() advances the source without decoding (only where the driver queues frames).
+    # With passthrough, read_compressed() -> the source's own JPEG bytes, or None when it has none to offer.
+    mode = None
+    can_grab = False
+    passthrough = False
+
+    def read(self):
+        raise NotImplementedError
+
+    def read_compressed(self):
+        return None
+
+    def grab(self):
+        return False
+
+    def release(self):
+        pass
+
+class PacedBackend(CameraBackend):
+    # Frames are handed out no faster than fps, like a real sensor (fps None: as fast as they can be made)
+    def __init__(self, fps=None):
+        self.fps = fps
+        self.next_time = 0
+
+    def wait_frame(self):
+        if not self.fps: return
+        now = time.monotonic()
+        if now < self.next_time:
+            time.sleep(self.next_time - now)
+        self.next_time = max(now, self.next_time) + 1 / self.fps
+
+class Picamera2Backend(CameraBackend):
+    mode = "PICAMERA2"
+
+    def __init__(self, width, height, **options):
+        self.picam2 = Picamera2()
+        config = self.picam2.create_still_configuration(main={"size": (width, height)})
+        self.picam2.configure(config)
+        self.picam2.start()
+        print("Mode: Raspberry Pi CSI (Picamera2)")
+
+    def read(self):
+        frame = self.picam2.capture_array()
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+
+    def release(self):
+        self.picam2.stop()
+
+class LegacyPicameraBackend(CameraBackend):
+    mode = "PICAMERA_LEGACY"
+
+    def __init__(self, width, height, fps=30, passthrough=False, **options):
+        self.passthrough = passthrough
+        self.legacy_cam = picamera.PiCamera()
+        self.legacy_cam.resolution = (width, height)
+        self.legacy_cam.framerate = fps
+        # 메모리 스트림을 위한 버퍼 준비
+        self.stream = io.BytesIO()
+        print("Mode: Raspberry Pi CSI (Legacy Picamera)")
+
+    def read_compressed(self):
+        # Legacy Picamera는 배열로 직접 받기보다 스트림을 통해 numpy로 변환하는 게 안정적입니다.
+        self.stream.seek(0)
+        self.stream.truncate(0)
+        self.legacy_cam.capture(self.stream, format='jpeg', use_video_port=True)
+        return self.stream.getvalue()
+
+    def read(self):
+        return decode_jpeg(self.read_compressed())
+
+    def release(self):
+        self.legacy_cam.close()
+
+class OpenCVBackend(CameraBackend):
+    mode = "OPENCV"
+    can_grab = True
+
+    def __init__(self, width, height, fps=30, camera_index=0, passthrough=False, **options):
+        self.capture = cv2.VideoCapture(camera_index)
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.capture.set(cv2.CAP_PROP_FPS, fps)
+        if passthrough:
+            # MJPEG from the camera, handed over undecoded (V4L2); drivers that refuse keep delivering BGR
+            self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            self.passthrough = self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        if self.capture.isOpened():
+            print(f"Mode: Standard OpenCV (Index: {camera_index}, passthrough: {self.passthrough})")
+        else:
+            print("Error: No camera detected.")
+
+    def read_raw(self):
+        ret, frame = self.capture.read()
+        if not ret: return None
+        if self.passthrough and (frame.ndim == 1 or frame.shape[0] == 1):
+            data = frame.tobytes()
+            if data[:2] == JPEG_SOI: return data
+        return frame
+
+    def read_compressed(self):
+        frame = self.read_raw()
+        if frame is None or isinstance(frame, bytes): return frame
+        # The driver decoded after all: stop asking for compressed frames and let it convert again.
+        # This frame came before the switch and may not be BGR, so the caller reads a new one.
+        self.passthrough = False
+        self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+        return None
+
+    def read(self):
+        frame = self.read_raw()
+        return decode_jpeg(frame) if isinstance(frame, bytes) else frame
+
+    def grab(self):
+        return self.capture.grab()
+
+    def release(self):
+        if self.capture.isOpened():
+            self.capture.release()
+
+class SyntheticBackend(PacedBackend):
+    # Deterministic moving scene: a bar sweeping over a fixed noise background, plus a frame counter
+    mode = "SYNTHETIC"
+
+    def __init__(self, width, height, fps=None, seed=0, **options):
+        super().__init__(fps)
+        rng = np.random.default_rng(seed)
+        self.background = cv2.GaussianBlur(rng.integers(0, 120, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+        self.count = 0
+        print(f"Mode: Synthetic ({width}x{height}, fps: {fps})")
+
+    def read(self):
+        self.wait_frame()
+        height, width = self.background.shape[:2]
+        frame = self.background.copy()
+        top = (self.count * 4) % height
+        cv2.rectangle(frame, (width // 4, top), (width * 3 // 4, top + height // 20), (210, 210, 210), -1)
+        cv2.putText(frame, f"{self.count:06d}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        self.count += 1
+        return frame
+
+class ReplayBackend(PacedBackend):
+    # Frames of a folder (e.g. a saved print capture) in name order, looped
+    mode = "REPLAY"
+
+    def __init__(self, width, height, folder, fps=None, loop=True, passthrough=False, **options):
+        super().__init__(fps)
+        self.folder = folder
+        self.loop = loop
+        self.names = sorted(name for name in os.listdir(folder) if name.endswith(FRAME_FORMAT))
+        # JPEG frames are replayed as they are stored, like an MJPEG camera
+        self.passthrough = passthrough and bool(self.names) and all(name.lower().endswith(JPEG_FORMAT) for name in self.names)
+        self.index = 0
+        if not self.names:
+            print(f"Error: No frames to replay in {folder}")
+        else:
+            print(f"Mode: Replay ({len(self.names)} frames from {folder}, fps: {fps})")
+
+    def next_file(self):
+        if self.index >= len(self.names):
+            if not self.loop or not self.names: return None
+            self.index = 0
+        self.wait_frame()
+        self.index += 1
+        return os.path.join(self.folder, self.names[self.index - 1])
+
+    def read_compressed(self):
+        file = self.next_file()
+        if file is None: return None
+        with open(file, 'rb') as f:
+            return f.read()
+
+    def read(self):
+        file = self.next_file()
+        return cv2.imread(file) if file is not None else None
+
+BACKENDS = {
+    "picamera2": Picamera2Backend,
+    "legacy": LegacyPicameraBackend,
+    "opencv": OpenCVBackend,
+    "synthetic": SyntheticBackend,
+    "replay": ReplayBackend
+}
+
+def create_backend(backend="auto", width=640, height=480, fps=30, camera_index=0, options=None):
+    # "auto": the Pi camera stacks that are installed, then OpenCV. options override the defaults (e.g. replay fps)
+    params = {"width": width, "height": height, "fps": fps, "camera_index": camera_index, **(options or {})}
+    if backend != "auto":
+        return BACKENDS[backend](**params)
+
+    if IS_RPI_LIBCAMERA:
+        try:
+            return Picamera2Backend(**params)
+        except Exception as e:
+            print(f"Picamera2 fail: {e}")
+    elif IS_RPI_LEGACY:
+        try:
+            return LegacyPicameraBackend(**params)
+        except Exception as e:
+            print(f"Legacy Picamera fail: {e}")
+    return OpenCVBackend(**params)
@@ -1,85 +1,237 @@
-import os, io, base64, cv2, time
-import numpy as np
-
-# 1. 라이브러리 체크 (우선순위: Picamera2 -> Picamera -> OpenCV)
-try:
-    from picamera2 import Picamera2
-    IS_RPI_LIBCAMERA = True
-    IS_RPI_LEGACY = False
-except (ImportError, RuntimeError):
-    IS_RPI_LIBCAMERA = False
-    try:
-        import picamera
-        IS_RPI_LEGACY = True
-    except (ImportError, RuntimeError):
-        IS_RPI_LEGACY = False
+import os, base64, cv2, time, threading
+from collections import deque
+from . import timelapse
+from . import cam_backend
+from . import frame_store
+
+# Named encodings of one captured frame: "archive" is written to disk, "live" is published to the browser.
+# width None keeps the capture size; quality is the WEBP quality.
+LIVE_RENDITION = {"width": 640, "quality": 40}
+# Passthrough frames (camera JPEG bytes) are decoded at 1/8, 1/4 or 1/2 scale by libjpeg when that is enough
+JPEG_REDUCED = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def get_renditions(webp_quality, renditions=None):
+    result = {"archive": {"width": None, "quality": webp_quality}, "live": dict(LIVE_RENDITION)}
+    for name, rendition in (renditions or {}).items():
+        result[name] = {**result.get(name, {"width": None, "quality": webp_quality}), **rendition}
+    return result
+
+class FrameSelector:
+    # Drops near-duplicate frames before they are encoded and written. Frames are compared as small grayscale
+    # thumbnails against the last kept frame (mean absolute difference, 0-255), so slow drift still adds up.
+    # A frame is always kept once max_gap seconds have passed since the last kept one.
+    def __init__(self, threshold=2.0, max_gap=30, size=(64, 36)):
+        self.threshold = threshold
+        self.max_gap = max_gap
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.last_thumbnail = None
+        self.last_time = None
+        self.kept = 0
+        self.skipped = 0
+
+    def get_thumbnail(self, frame):
+        if isinstance(frame, bytes):
+            gray = cam_backend.decode_jpeg(frame, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            if gray is None: return None
+        else:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+
+    def get_difference(self, thumbnail):
+        return float(cv2.absdiff(thumbnail, self.last_thumbnail).mean())
+
+    def should_keep(self, frame, now=None):
+        now = time.monotonic() if now is None else now
+        thumbnail = self.get_thumbnail(frame)
+        # Corrupt passthrough frame: nothing to save
+        if thumbnail is None: return False
+        keep = self.last_thumbnail is None or now - self.last_time >= self.max_gap or self.get_difference(thumbnail) >= self.threshold
+        if keep:
+            self.last_thumbnail = thumbnail
+            self.last_time = now
+            self.kept += 1
+        else:
+            self.skipped += 1
+        return keep
+
+    def get_stats(self):
+        return {"kept": self.kept, "skipped": self.skipped}
 
 class CamManager:
-    def __init__(self, camera_index=0, width=640, height=480, fps=30, webp_quality=50, cam_folder=""):
+    def __init__(self, camera_index=0, width=640, height=480, fps=30, webp_quality=50, cam_folder="", timelapse_fps=30, motion_threshold=None, motion_max_gap=30, capture_fps=None, buffer_frames=4, renditions=None, backend="auto", backend_options=None, passthrough=False, store_budget=None):
         self.camera_index = camera_index
         self.width = width
         self.height = height
         self.fps = fps
         self.webp_quality = webp_quality
         self.cam_folder = cam_folder
-        self.mode = "OPENCV"  
+        # Every saved frame is indexed; over store_budget bytes, older frames are thinned (None: no limit)
+        self.frame_store = frame_store.FrameStore(cam_folder, max_bytes=store_budget)
+        # Saved frames are also encoded into the timelapse as they arrive (None: only the batch path)
+        self.timelapse_fps = timelapse_fps
+        # Saved frames that barely differ from the last saved one are skipped (None: save every frame)
+        self.frame_selector = FrameSelector(threshold=motion_threshold, max_gap=motion_max_gap) if motion_threshold is not None else None
+        self.selector_folder = None
+        self.last_encoded = None
+        # Each rendition is encoded at most once per frame id, however many callers ask for it
+        self.renditions = get_renditions(webp_quality, renditions)
+        self.rendition_cache = dict()    # name -> (frame id, encoded buffer)
+        self.rendition_times = {name: deque(maxlen=30) for name in self.renditions}
+        self.rendition_lock = threading.Lock()
+        self.decoded = (None, None)    # (frame id, BGR image) of the last passthrough frame decoded in full
+        self.live_format = "webp"
+        # Background capture: newest frames with their timestamps (None: capture on demand in the caller's thread)
+        self.capture_fps = capture_fps
+        self.frame_buffer = deque(maxlen=buffer_frames)
+        self.frame_lock = threading.Lock()
+        self.frame_id = 0
+        self.capture_times = deque(maxlen=30)
+        self.capture_errors = 0
+        self.capture_stop = threading.Event()
+        self.capture_thread = None
         
-        # 2. 모드 결정 및 초기화
-        if IS_RPI_LIBCAMERA:
-            try:
-                self.picam2 = Picamera2()
-                config = self.picam2.create_still_configuration(main={"size": (self.width, self.height)})
-                self.picam2.configure(config)
-                self.picam2.start()
-                self.mode = "PICAMERA2"
-                print("Mode: Raspberry Pi CSI (Picamera2)")
-            except Exception as e:
-                print(f"Picamera2 fail: {e}")
-                self._init_opencv()
+        # auto: Picamera2 -> legacy Picamera -> OpenCV; "synthetic" / "replay" run without a camera
+        # passthrough: keep the camera's own JPEG/MJPEG frames and only transcode renditions that need another size
+        self.backend = cam_backend.create_backend(backend, width=self.width, height=self.height, fps=self.fps, camera_index=self.camera_index, options={"passthrough": passthrough, **(backend_options or {})})
+        self.mode = self.backend.mode
+        
+        if self.capture_fps is not None:
+            self.start_capture()
+
+    def _get_frame(self):
+        # BGR frame, or the camera's JPEG bytes in passthrough mode
+        if self.backend.passthrough:
+            data = self.backend.read_compressed()
+            if data is not None: return data
+        return self.backend.read()
+
+    def get_frame_image(self, latest):
+        # Full BGR image of a buffered frame; passthrough frames are decoded once per frame id (None if corrupt)
+        frame_id, _, frame = latest
+        if not isinstance(frame, bytes): return frame
+        with self.rendition_lock:
+            if self.decoded[0] != frame_id:
+                self.decoded = (frame_id, cam_backend.decode_jpeg(frame))
+            return self.decoded[1]
+
+    def start_capture(self):
+        if self.capture_thread is not None and self.capture_thread.is_alive(): return
+        self.capture_stop.clear()
+        self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.capture_thread.start()
+
+    def stop_capture(self):
+        self.capture_stop.set()
+        if self.capture_thread is not None:
+            self.capture_thread.join(timeout=5)
+            self.capture_thread = None
 
-        elif IS_RPI_LEGACY:
+    def _capture_loop(self):
+        # The only user of the camera while running; readers just take the newest buffered frame
+        interval = 1 / self.capture_fps
+        next_time = 0
+        while not self.capture_stop.is_set():
             try:
-                import picamera
-                self.legacy_cam = picamera.PiCamera()
-                self.legacy_cam.resolution = (self.width, self.height)
-                self.legacy_cam.framerate = self.fps
-                # 메모리 스트림을 위한 버퍼 준비
-                self.stream = io.BytesIO()
-                self.mode = "PICAMERA_LEGACY"
-                print("Mode: Raspberry Pi CSI (Legacy Picamera)")
+                now = time.monotonic()
+                if now < next_time:
+                    if self.backend.can_grab:
+                        # Keep draining the driver queue (grab only, no decode) so the next frame is current
+                        if not self.backend.grab(): self.capture_stop.wait(0.05)
+                    else:
+                        self.capture_stop.wait(next_time - now)
+                    continue
+                next_time = now + interval
+                frame = self._get_frame()
+                if frame is None:
+                    self.capture_errors += 1
+                    self.capture_stop.wait(0.1)
+                    continue
+                captured = time.time()
+                with self.frame_lock:
+                    self.frame_id += 1
+                    self.frame_buffer.append((self.frame_id, captured, frame))
+                    self.capture_times.append(captured)
             except Exception as e:
-                print(f"Legacy Picamera fail: {e}")
-                self._init_opencv()
-        else:
-            self._init_opencv()
-
-    def _init_opencv(self):
-        self.capture = cv2.VideoCapture(self.camera_index)
-        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
-        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
-        self.capture.set(cv2.CAP_PROP_FPS, self.fps)
-        if self.capture.isOpened():
-            self.mode = "OPENCV"
-            print(f"Mode: Standard OpenCV (Index: {self.camera_index})")
-        else:
-            print("Error: No camera detected.")
+                self.capture_errors += 1
+                print(f"Capture error: {e}")
+                self.capture_stop.wait(1)
 
-    def _get_frame(self):
-        if self.mode == "PICAMERA2":
-            frame = self.picam2.capture_array()
-            return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        
-        elif self.mode == "PICAMERA_LEGACY":
-            # Legacy Picamera는 배열로 직접 받기보다 스트림을 통해 numpy로 변환하는 게 안정적입니다.
-            self.stream.seek(0)
-            self.legacy_cam.capture(self.stream, format='jpeg', use_video_port=True)
-            data = np.frombuffer(self.stream.getvalue(), dtype=np.uint8)
-            self.stream.truncate(0)
-            return cv2.imdecode(data, cv2.IMREAD_COLOR)
+    def get_latest_frame(self):
+        # (frame id, capture time, frame) of the newest frame, without waiting for the camera
+        if self.capture_thread is None:
+            frame = self._get_frame()
+            if frame is None: return None
+            with self.frame_lock:
+                self.frame_id += 1
+                return self.frame_id, time.time(), frame
+        with self.frame_lock:
+            return self.frame_buffer[-1] if self.frame_buffer else None
 
-        else:
-            ret, frame = self.capture.read()
-            return frame if ret else None
+    def get_capture_stats(self):
+        with self.frame_lock:
+            times = list(self.capture_times)
+            frames = self.frame_id
+        return {
+            "fps": round((len(times) - 1) / (times[-1] - times[0]), 2) if len(times) > 1 and times[-1] > times[0] else 0,
+            "frame_age": round(time.time() - times[-1], 3) if times else None,
+            "frames": frames,
+            "errors": self.capture_errors
+        }
+
+    def get_rendition(self, latest, name: str):
+        # (encoded buffer, file extension) of one rendition of a buffered frame; (None, None) if it does not decode
+        frame_id, _, frame = latest
+        with self.rendition_lock:
+            cached = self.rendition_cache.get(name)
+            if cached is not None and cached[0] == frame_id:
+                return cached[1], cached[2]
+            
+            started = time.perf_counter()
+            rendition = self.renditions[name]
+            if isinstance(frame, bytes):
+                size = cam_backend.get_jpeg_size(frame)
+                if size is not None and (rendition["width"] is None or size[0] <= rendition["width"]):
+                    # Already what this rendition needs: the camera's JPEG as is
+                    buffer, extension = frame, ".jpg"
+                else:
+                    frame = self.decode_reduced(frame, size, rendition["width"])
+                    if frame is None: return None, None
+                    buffer, extension = None, ".webp"
+            else:
+                buffer, extension = None, ".webp"
+            
+            if buffer is None:
+                if rendition["width"] is not None and frame.shape[1] > rendition["width"]:
+                    height = round(frame.shape[0] * rendition["width"] / frame.shape[1])
+                    frame = cv2.resize(frame, (rendition["width"], height), interpolation=cv2.INTER_AREA)
+                _, buffer = cv2.imencode('.webp', frame, [cv2.IMWRITE_WEBP_QUALITY, rendition["quality"]])
+            self.rendition_times[name].append((time.perf_counter() - started, len(buffer)))
+            self.rendition_cache[name] = (frame_id, buffer, extension)
+            return buffer, extension
+
+    def decode_reduced(self, data: bytes, size, width):
+        # Smallest libjpeg scale that still covers the target width
+        if size is not None and width is not None:
+            for scale, flag in JPEG_REDUCED:
+                if size[0] // scale >= width:
+                    return cam_backend.decode_jpeg(data, flag)
+        return cam_backend.decode_jpeg(data)
+
+    def get_rendition_stats(self):
+        # Average encode time (ms) and size (bytes) of each rendition over its recent frames
+        with self.rendition_lock:
+            return {
+                name: {
+                    "encode_ms": round(sum(t for t, _ in times) / len(times) * 1000, 2) if times else None,
+                    "bytes": round(sum(size for _, size in times) / len(times)) if times else None
+                } for name, times in self.rendition_times.items()
+            }
+
+    def get_storage_usage(self):
+        return self.frame_store.get_usage()
 
     def exists_cam_folder(self, sub_folder) -> bool:
         return os.path.exists(os.path.join(self.cam_folder, sub_folder))
@@ -88,31 +240,65 @@ class CamManager:
         os.makedirs(os.path.join(self.cam_folder, sub_folder), exist_ok=True)
 
     def save_image(self, sub_folder):
-        frame = self._get_frame()
-        if frame is None: return None
+        latest = self.get_latest_frame()
+        if latest is None: return None
+        frame = latest[2]
         
-        _, buffer = cv2.imencode('.webp', frame, [cv2.IMWRITE_WEBP_QUALITY, self.webp_quality])
+        if self.frame_selector is not None:
+            if self.selector_folder != sub_folder:
+                self.frame_selector.reset()
+                self.selector_folder = sub_folder
+                self.last_encoded = None
+            # Nothing moved: no encode, no write; the live view keeps the last saved image
+            if self.frame_selector.should_keep(frame) == False and self.last_encoded is not None:
+                return self.last_encoded
+        
+        buffer, extension = self.get_rendition(latest, "archive")
+        if buffer is None: return None
         
         save_path = os.path.join(self.cam_folder, sub_folder)
         os.makedirs(save_path, exist_ok=True)
-        file_path = os.path.join(save_path, f"cam-{int(time.time())}.webp")
+        # A second save within the same second gets a suffix that still sorts after the first
+        timestamp = int(time.time())
+        file_name = f"cam-{timestamp}{extension}"
+        count = 0
+        while os.path.exists(os.path.join(save_path, file_name)):
+            count += 1
+            file_name = f"cam-{timestamp}_{count:02d}{extension}"
+        file_path = os.path.join(save_path, file_name)
         
         with open(file_path, 'wb') as f:
             f.write(buffer)
+        self.frame_store.add_frame(sub_folder, file_name, len(buffer))
         
-        return base64.b64encode(buffer).decode('utf-8')
+        if self.timelapse_fps is not None:
+            try:
+                image = self.get_frame_image(latest)
+                if image is not None:
+                    timelapse.get_writer(save_path, fps=self.timelapse_fps).add_frame(image, file_name)
+            except Exception as e:
+                print(f"Timelapse frame error: {e}")
+        
+        self.last_encoded = self.get_live_image(latest)
+        return self.last_encoded
+
+    def finish_timelapse(self, sub_folder):
+        # Closes the open segment and merges all segments into <sub_folder>/<sub_folder>.mp4
+        save_path = os.path.join(self.cam_folder, sub_folder)
+        if self.timelapse_fps is None or timelapse.has_timelapse(save_path) == False: return None
+        return timelapse.get_writer(save_path, fps=self.timelapse_fps).finish(os.path.join(save_path, f"{sub_folder}.mp4"))
 
     def capture_image(self):
-        frame = self._get_frame()
-        if frame is None: return None
-        
-        _, buffer = cv2.imencode('.webp', frame, [cv2.IMWRITE_WEBP_QUALITY, self.webp_quality])
+        latest = self.get_latest_frame()
+        if latest is None: return None
+        return self.get_live_image(latest)
+
+    def get_live_image(self, latest):
+        buffer, extension = self.get_rendition(latest, "live")
+        if buffer is None: return None
+        self.live_format = "jpeg" if extension == ".jpg" else "webp"
         return base64.b64encode(buffer).decode('utf-8')
 
     def release(self):
-        if self.mode == "PICAMERA2":
-            self.picam2.stop()
-        elif self.mode == "PICAMERA_LEGACY":
-            self.legacy_cam.close()
-        elif hasattr(self, 'capture') and self.capture.isOpened():
-            self.capture.release()
\ No newline at end of file
+        self.stop_capture()
+        self.backend.release()
@@ -1,14 +1,25 @@
-import os, io, json , base64, time, glob
+import os, io, json , base64, time, glob, sys, threading
 from PIL import Image
 import zipfile
 import shutil
 import xmltodict
 from . import img_process
+from . import log_manager
+from . import folder_scanner
+from . import slice_analysis
+from . import slice_parser
+from . import slice_container
+from . import timelapse
 from collections import OrderedDict
 
 SLICE_FORMAT = (".slice",".crmaslice",".cws",".cmz")
+# Per-layer blob detail in print history: full sorted size lists, histogram/quantile summary, totals only,
+# or full sizes in a separate binary container (slice_container) that the history references by name
+BLOB_MODES = ("raw", "summary", "total", "binary")
+PREVIEW_CACHE_FILE = "preview-cache.json"
+PREVIEW_CACHE_SIZE = 256
 class FileManager: 
-    def __init__(self, device_type, device_number, data_folder, recipe_folder, setting_folder, log_folder, history_folder, cam_folder):
+    def __init__(self, device_type, device_number, data_folder, recipe_folder, setting_folder, log_folder, history_folder, cam_folder, analysis_workers=None, history_blob="summary", idx_verify=3, analysis_memory_budget=None, small_blob=img_process.SMALL_BLOB_PIXELS, container_compression="zlib"):
         self.device_type = device_type
         self.device_number = device_number
         self.data_folder = data_folder
@@ -17,11 +28,86 @@ class FileManager:
         self.log_folder = log_folder
         self.history_folder = history_folder
         self.cam_folder = cam_folder
+        # Slice analysis processes (None: one per CPU core)
+        self.analysis_workers = analysis_workers
+        # Bytes per analysis worker; larger slices are labelled strip by strip (None: whole image)
+        self.analysis_memory_budget = analysis_memory_budget
+        # One of BLOB_MODES ("total" reads the IDX [PixelData] section when present); True/False mean "raw"/"total"
+        self.history_blob = self.get_blob_mode(history_blob)
+        self.small_blob = small_blob
+        # Payload compression of the "binary" blob container (None / "zlib" / "lzma")
+        self.container_compression = container_compression
+        # Layers decoded to cross-check IDX totals before trusting them (0: trust without checking)
+        self.idx_verify = idx_verify
         
         self.print_data = dict()
         self.print_recipe = dict()
         self.device_setting = dict()
         
+        # Incremental views of the data / recipe / setting folders, updated from scanner events
+        self.data_scanner = folder_scanner.FolderScanner(self.data_folder, include=lambda entry: entry.is_dir() and self.is_slicefolder(entry.name)[0])
+        self.recipe_scanner = folder_scanner.FolderScanner(self.recipe_folder, include=self.is_recipeentry)
+        # Only X1 / DM400 keep their settings in setting_folder; other devices have none to scan
+        self.setting_scanner = folder_scanner.FolderScanner(self.setting_folder, include=lambda entry: entry.is_file() and self.is_settingfile(entry.name)) if self.device_type == "X1" or self.device_type == "DM400" else None
+        self.print_data_index = dict()
+        self.print_recipe_index = dict()
+        self.device_setting_index = dict()
+        
+        # Encoded previews keyed by path, valid while (mtime, size, width) match; LRU order, persisted across restarts
+        self.preview_cache = OrderedDict()
+        self.preview_cache_dirty = False
+        self.preview_cache_lock = threading.Lock()
+        self.load_preview_cache()
+        
+    def get_resource_path(self, relative_path: str):
+        if getattr(sys, 'frozen', False):
+            # PyInstaller EXE
+            base_path = os.path.dirname(sys.executable)
+        else:
+            # DEVELOP
+            base_path = os.path.abspath(".")
+
+        return os.path.join(base_path, relative_path)
+    
+    def load_preview_cache(self):
+        try:
+            with open(self.get_resource_path(PREVIEW_CACHE_FILE), 'r', encoding='utf-8') as f:
+                self.preview_cache = OrderedDict(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"load_preview_cache error: {e}")
+    
+    def save_preview_cache(self):
+        with self.preview_cache_lock:
+            if self.preview_cache_dirty == False: return
+            try:
+                temp_file = self.get_resource_path(f"{PREVIEW_CACHE_FILE}.tmp")
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.preview_cache, f, separators=(',', ':'))
+                os.replace(temp_file, self.get_resource_path(PREVIEW_CACHE_FILE))
+                self.preview_cache_dirty = False
+            except Exception as e:
+                print(f"save_preview_cache error: {e}")
+    
+    def get_cached_previewimg(self, file: str, width: int):
+        stat = os.stat(file)
+        signature = [stat.st_mtime_ns, stat.st_size, width]
+        with self.preview_cache_lock:
+            cached = self.preview_cache.get(file)
+            if cached is not None and cached[:3] == signature:
+                self.preview_cache.move_to_end(file)
+                return cached[3]
+        
+        encoded = self.encode_previewimg(file, width)
+        with self.preview_cache_lock:
+            self.preview_cache[file] = signature + [encoded]
+            self.preview_cache.move_to_end(file)
+            while len(self.preview_cache) > PREVIEW_CACHE_SIZE:
+                self.preview_cache.popitem(last=False)
+            self.preview_cache_dirty = True
+        return encoded
+        
     def is_slicefolder(self, folder: str):
         for sf in SLICE_FORMAT:
             if sf in folder: 
@@ -40,6 +126,13 @@ class FileManager:
         else:
             return False
     
+    def is_recipeentry(self, entry: os.DirEntry):
+        if entry.is_file() == False:
+            return False
+        if self.device_type == "X1" or self.device_type == "DM400":
+            return self.is_recipefile(entry.name)
+        return entry.name == "resin.cfg"
+    
     def is_settingfile(self, file: str):
         if self.device_type == "X1" or self.device_type == "DM400":
             if "SaveFile.xml" in file:
@@ -140,80 +233,105 @@ class FileManager:
             
         return resin_list
 
-    def get_print_data(self):
+    def get_file_events(self):
+        # added / removed / modified events per category since the previous call
+        events = dict()
+        for category, scanner in (("data", self.data_scanner), ("recipe", self.recipe_scanner), ("setting", self.setting_scanner)):
+            if scanner is None:
+                events[category] = list()
+                continue
+            try:
+                events[category] = scanner.scan()
+            except Exception as e:
+                print(f"get_file_events error ->{category}: {str(e)}")
+                events[category] = list()
+        return events
+
+    def get_print_data_entry(self, slice: str):
+        files = self.get_files(slice)
+        preview = self.get_previewimg(files)
+        if len(preview) == 0 or (self.get_idx_file(files) is None and self.get_gcode_file(files) is None):
+            shutil.rmtree(slice)
+            return None
+        
+        return {
+            "preview": self.get_cached_previewimg(preview[0], 120),
+            "size": os.path.getsize(slice)
+        }
+
+    def get_print_data(self, events=None):
         try:
-            folders = self.get_subfolder(self.data_folder)
-            files = self.get_files(self.data_folder)
-            
-            slices = {
-                "folders": list(),
-                "files": list()
-            }
+            if events is None:
+                events = self.data_scanner.scan()
             
-            for folder in folders: 
-                valid, form = self.is_slicefolder(folder)
-                if valid == True:
-                    slices["folders"].append(folder)
-                    
-            for file in files:
-                if self.is_slicefile(file):
-                    slices["files"].append(file)
-            
-            print_data = dict() 
-            for slice in slices["folders"]:
-                name = os.path.basename(slice)
-                files = self.get_files(slice)
-                preview = self.get_previewimg(files)
-                if len(preview) == 0 or (self.get_idx_file(files) is None and self.get_gcode_file(files) is None):
-                    shutil.rmtree(slice)
+            for event in events:
+                if event["type"] == "removed":
+                    self.print_data_index.pop(event["name"], None)
+                    slice_analysis.remove_analysis_cache(self.get_resource_path(slice_analysis.ANALYSIS_CACHE_FOLDER), event["path"])
+                    continue
+                entry = self.get_print_data_entry(event["path"])
+                if entry is None:
+                    self.print_data_index.pop(event["name"], None)
                 else:
-                    encoded = self.encode_previewimg(preview[0], 120)
+                    self.print_data_index[event["name"]] = entry
                     
-                    print_data[name] = {
-                        "preview": encoded,
-                        "size": os.path.getsize(slice)
-                    }  
-                    
-            for file in slices["files"]:
-                pass
-            return print_data
+            self.save_preview_cache()
+            return dict(self.print_data_index)
         except Exception as e:
             print(f"get_print_data error: {str(e)}")
+            self.data_scanner.reset()
+            self.print_data_index = dict()
             return None
         
-    def get_print_recipe(self):
+    def get_print_recipe(self, events=None):
         try: 
             if self.device_type == "X1" or self.device_type == "DM400":
-                files = self.get_files(self.recipe_folder)
-                recipe_dic = dict()
-                for file in files:
-                    if self.is_recipefile(file):
-                        recipe_dic[os.path.basename(file)] = {
-                            "content": self.convert_xml_to_json(file),
-                            "size": os.path.getsize(file)
+                if events is None:
+                    events = self.recipe_scanner.scan()
+                for event in events:
+                    if event["type"] == "removed":
+                        self.print_recipe_index.pop(event["name"], None)
+                    else:
+                        self.print_recipe_index[event["name"]] = {
+                            "content": self.convert_xml_to_json(event["path"]),
+                            "size": os.path.getsize(event["path"])
                         }
-                return True, recipe_dic    
+                return True, dict(self.print_recipe_index)    
             elif self.device_type in ["DM4K", "IML", "IML16K", "IMDC", "IMD", "ZENESIS"]:
-                recipe_dic = dict()
-                recipe_dic["recipe-list"] = self.extract_resins(os.path.join(self.recipe_folder, "resin.cfg"))
-                return True, recipe_dic
+                if events is None:
+                    events = self.recipe_scanner.scan()
+                if events or "recipe-list" not in self.print_recipe_index:
+                    self.print_recipe_index = {"recipe-list": self.extract_resins(os.path.join(self.recipe_folder, "resin.cfg"))}
+                return True, dict(self.print_recipe_index)
             else:
                 return False, None
         except Exception as e:
             print(f"get_print_recipe error: {str(e)}")
+            self.recipe_scanner.reset()
+            self.print_recipe_index = dict()
             return False, None
         
-    def get_device_setting(self):
-        if self.device_type == "X1" or self.device_type == "DM400":
-            files = self.get_files(self.setting_folder)
-            setting_dic = dict()
-            for file in files:
-                if self.is_settingfile(file):
-                    setting_dic = self.convert_xml_to_json(file)
-            return True, setting_dic    
-        elif self.device_type in ["DM4K", "IML", "IML16K", "IMDC", "IMD", "ZENESIS"]:
-            return True, dict()
-        else:
+    def get_device_setting(self, events=None):
+        try:
+            if self.device_type == "X1" or self.device_type == "DM400":
+                if events is None:
+                    events = self.setting_scanner.scan()
+                for event in events:
+                    if event["type"] == "removed":
+                        self.device_setting_index.pop(event["name"], None)
+                    else:
+                        self.device_setting_index[event["name"]] = self.convert_xml_to_json(event["path"])
+                if len(self.device_setting_index) == 0:
+                    return True, dict()
+                return True, self.device_setting_index[sorted(self.device_setting_index)[-1]]
+            elif self.device_type in ["DM4K", "IML", "IML16K", "IMDC", "IMD", "ZENESIS"]:
+                return True, dict()
+            else:
+                return False, None
+        except Exception as e:
+            print(f"get_device_setting error: {str(e)}")
+            self.setting_scanner.reset()
+            self.device_setting_index = dict()
             return False, None
     
     def get_device_log_updatelist(self):
@@ -232,8 +350,16 @@ class FileManager:
         except Exception as e:
             return False, str(e)
         
-    def get_device_log(self, file: str):
+    def get_device_log(self, file: str, segment=False):
+        # The {"device", "data"} log document; with segment, columnar segments are returned as their compressed bytes
         try:
+            if log_manager.is_segment_file(file):
+                if segment == False:
+                    return True, log_manager.convert_segment_to_log(os.path.join(self.log_folder, file))
+                with open(os.path.join(self.log_folder, file), 'rb') as f:
+                    return True, f.read()
+            if file.endswith(".jsonl"):
+                return True, log_manager.convert_jsonl_to_log(os.path.join(self.log_folder, file))
             with open(os.path.join(self.log_folder, file), 'r', encoding='utf-8') as f:
                 device_log = json.load(f)
             return True, device_log
@@ -256,25 +382,70 @@ class FileManager:
         except Exception as e:
             return False, str(e)
     
-    def get_print_data_blob(self, slice: str):
+    def report_analysis_progress(self, progress: dict):
+        if progress["done"] % 100 == 0 or progress["done"] == progress["total"]:
+            print(f"get_print_data_blob: {progress['done']}/{progress['total']} layers ({progress['rate']} layer/s)")
+    
+    def verify_pixel_totals(self, slice: str, totals: dict, samples: int):
+        # Decode `samples` evenly spaced layers and compare their white pixel count with the IDX value
+        names = sorted(totals)
+        if samples <= 0 or len(names) == 0:
+            return True, list()
+        step = max(1, len(names) // samples)
+        mismatch = list()
+        for name in names[::step][:samples]:
+            counted = img_process.count_white_pixels(os.path.join(self.data_folder, slice, name))
+            if counted != totals[name]:
+                mismatch.append({"name": name, "idx": totals[name], "image": counted})
+        return len(mismatch) == 0, mismatch
+    
+    def get_print_data_totals(self, slice: str):
+        try:
+            idx = self.get_idx_file(self.get_files(os.path.join(self.data_folder, slice)))
+            totals = slice_parser.get_pixel_totals(idx) if idx is not None else dict()
+            if len(totals) == 0:
+                return False, "No PixelData in IDX"
+            
+            valid, mismatch = self.verify_pixel_totals(slice, totals, self.idx_verify)
+            if valid == False:
+                print(f"get_print_data_totals: IDX PixelData does not match images in {slice}: {mismatch}")
+                return False, mismatch
+            return True, {name: {"total": totals[name]} for name in sorted(totals)}
+        except Exception as e:
+            return False, str(e)
+    
+    def get_blob_mode(self, blob):
+        if blob is True: return "raw"
+        if blob is False: return "total"
+        if blob not in BLOB_MODES:
+            print(f"Invalid blob mode: {blob} (use one of {BLOB_MODES})")
+            return "raw"
+        return blob
+    
+    def get_print_data_blob(self, slice: str, blob="raw"):
         try: 
             #print(f"get_print_data_blob: {slice}")
-            blob = dict(); i=1
-            while True:
-                # print(f"{self.data_folder}/{slice}/SEC_{i:04d}.png")
-                if os.path.exists(os.path.join(self.data_folder, slice, f"SEC_{i:04d}.png")):
-                    blob[f"SEC_{i:04d}.png"] = img_process.analyze_dlp_slice_image(os.path.join(self.data_folder, slice, f"SEC_{i:04d}.png"))
-                    i+=1
-                else: 
-                    #print("\n==========================================\nget_print_data_blob END\n==========================================\n")
-                    break
-            return True, blob
+            blob = self.get_blob_mode(blob)
+            if blob == "total":
+                valid, totals = self.get_print_data_totals(slice)
+                if valid == True:
+                    return True, totals
+            
+            # The cache keeps only what this mode sends: full size lists for raw/binary, summaries or totals otherwise
+            if blob == "summary":
+                reduce, store = lambda layer: img_process.to_summary_result(layer, self.small_blob), {"blob": blob, "small_blob": self.small_blob}
+            elif blob == "total":
+                reduce, store = lambda layer: {"total": layer["total"]} if layer is not False else layer, {"blob": blob}
+            else:
+                reduce, store = None, None
+            analyzed = slice_analysis.analyze_slices_cached(os.path.join(self.data_folder, slice), self.get_resource_path(slice_analysis.ANALYSIS_CACHE_FOLDER), workers=self.analysis_workers, progress=self.report_analysis_progress, memory_budget=self.analysis_memory_budget, reduce=reduce, store=store)
+            return True, dict(analyzed)
         except Exception as e:
             return False, str(e)
     
     def get_frame_count(self, folder: str):
         try:
-            images = [img for img in os.listdir(os.path.join(self.cam_folder, folder)) if img.endswith((".webp"))]
+            images = [img for img in os.listdir(os.path.join(self.cam_folder, folder)) if img.endswith((".webp", ".jpg"))]
             return True, len(images)
         except Exception as e:
             print(f"get_frame_count error: {e}")
@@ -282,16 +453,23 @@ class FileManager:
     
     def get_timelapse_video(self, folder: str):
         try:
-            img_process.create_timelapse(src_folder=os.path.join(self.cam_folder, folder), output_file=os.path.join(self.cam_folder, folder, f"{folder}.mp4"), fps=30)
-            return True, os.path.join(self.cam_folder, folder, f"{folder}.mp4") 
+            src_folder = os.path.join(self.cam_folder, folder)
+            output_file = os.path.join(src_folder, f"{folder}.mp4")
+            if timelapse.has_timelapse(src_folder):
+                # Encoded during the print: only the open segment and the merge are left (no-op if already finished)
+                if timelapse.get_writer(src_folder, fps=30).finish(output_file) is None:
+                    return False, None
+                return True, output_file
+            img_process.create_timelapse(src_folder=src_folder, output_file=output_file, fps=30)
+            return True, output_file
         except Exception as e:
             print(f"get_timelapse_video error: {e}")
             return False, None
         
     def get_preview_zip(self, folder: str):
         try:
-            img_process.create_preview_zip(src_folder=os.path.join(self.cam_folder, folder), output_file=os.path.join(self.cam_folder, folder, folder))
-            return True, os.path.join(self.cam_folder, folder, f"{folder}.zip")
+            # In-memory archive (BytesIO): nothing is written to the SD card
+            return True, img_process.create_preview_zip(src_folder=os.path.join(self.cam_folder, folder))
         except Exception as e:
             print(f"get_preview_zip error: {e}")
             return False, None
@@ -303,6 +481,7 @@ class FileManager:
                 for image in images:
                     file_path = os.path.join(self.cam_folder, folder, image)
                     os.remove(file_path)
+            timelapse.release_writer(os.path.join(self.cam_folder, folder))
             return True
         except Exception as e:
             print(f"clean_timelapse_frame error: {e}")
@@ -324,7 +503,10 @@ class FileManager:
             # print_history["storage"]["data"]["gcode"] = self.get_gcode_file(files) # Add function that convert gcode content to json 
             # print(f"IDX: {print_history["storage"]["data"]["idx"]} / GCODE: {print_history["storage"]["data"]["gcode"]}")
             
-            print_history["storage"]["data"]["slices"] = self.get_print_data_blob(print_history["database"]["print"]["data"])[1] 
+            if self.history_blob == "binary":
+                print_history["storage"]["data"]["slices"] = self.create_print_history_slices(file, print_history["database"]["print"]["data"])
+            else:
+                print_history["storage"]["data"]["slices"] = self.get_print_data_blob(print_history["database"]["print"]["data"], blob=self.history_blob)[1] 
             # ================================================================================
             print_history["storage"]["recipe"] = self.convert_xml_to_json(os.path.join(self.recipe_folder, print_history['database']['print']['recipe']))
             
@@ -335,6 +517,23 @@ class FileManager:
         except Exception as e:
             return False, str(e)
     
+    def create_print_history_slices(self, file: str, slice: str):
+        # Full per-layer sizes go to <history>.cslc next to the history file; the history keeps only a reference
+        valid, layers = self.get_print_data_blob(slice, blob="binary")
+        if valid == False:
+            return layers
+        container = f"{os.path.splitext(file)[0]}{slice_container.CONTAINER_EXTENSION}"
+        slice_container.write_slice_container(os.path.join(self.history_folder, container), layers, compression=self.container_compression)
+        return {"container": container, "compression": self.container_compression, "layers": len(layers)}
+    
+    def get_print_history_slices(self, container: str):
+        try:
+            with open(os.path.join(self.history_folder, container), 'rb') as f:
+                return True, f.read()
+        except Exception as e:
+            print(f"get_print_history_slices error: {e}")
+            return False, None
+    
     def set_print_history(self, data: dict):
         with open(f"print-history-{int(time.time())}.json", 'w', encoding='utf-8') as content:
             json.dump(data, content, ensure_ascii=False, indent=4)
@@ -0,0 +1,51 @@
+import os
+
+class FolderScanner:
+    def __init__(self, folder: str, include=None):
+        # include(entry: os.DirEntry) -> bool decides which entries are tracked
+        self.folder = folder
+        self.include = include
+        self.index = dict()
+
+    def reset(self):
+        # Forget the index so the next scan reports every entry as added
+        self.index = dict()
+
+    def get_signature(self, entry: os.DirEntry):
+        # One stat per entry: a folder is "modified" when files are added, removed or renamed in it (its own mtime).
+        # Files rewritten in place inside a folder are not seen; statting every slice image each second costs too much.
+        stat = entry.stat()
+        return (entry.is_dir(), stat.st_mtime_ns, stat.st_size)
+
+    def scan(self):
+        current = dict()
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                try:
+                    if self.include is not None and not self.include(entry): continue
+                    current[entry.name] = self.get_signature(entry)
+                except FileNotFoundError:
+                    # Removed between readdir and stat
+                    continue
+
+        events = list()
+        for name, signature in current.items():
+            previous = self.index.get(name)
+            if previous is None:
+                events.append(self.create_event("added", name, signature))
+            elif previous != signature:
+                events.append(self.create_event("modified", name, signature))
+        for name, signature in self.index.items():
+            if name not in current:
+                events.append(self.create_event("removed", name, signature))
+
+        self.index = current
+        return events
+
+    def create_event(self, event_type: str, name: str, signature: tuple):
+        return {
+            "type": event_type,
+            "name": name,
+            "path": os.path.join(self.folder, name),
+            "is_dir": signature[0]
+        }
@@ -0,0 +1,135 @@
+import os, re, time, heapq, bisect, threading
+
+FRAME_FORMAT = (".jpg", ".png", ".jpeg", ".webp")
+FRAME_TIME_PATTERN = re.compile(r"^cam-(\d+)[._]")
+# Newest frames of every print are never evicted (the preview ZIP is built from them); the first and last always stay
+PROTECT_FRAMES = 30
+# Thinning goes down to this share of the budget, so it does not run again for every new frame
+LOW_WATER = 0.9
+# Files can also disappear behind the store's back (clean_timelapse_frame), so the index is rebuilt this often
+REFRESH_INTERVAL = 60
+
+def get_frame_time(entry):
+    match = FRAME_TIME_PATTERN.match(entry.name)
+    return int(match.group(1)) if match else int(entry.stat().st_mtime)
+
+class FrameStore:
+    # Index of saved camera frames by print (sub folder) and capture time, kept under a byte budget.
+    # Over budget, frames are thinned evenly across every print, older ones more, instead of whole prints being dropped.
+    def __init__(self, folder: str, max_bytes=None, protect_frames=PROTECT_FRAMES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.protect_frames = protect_frames
+        self.lock = threading.Lock()
+        self.prints = dict()    # print -> {"times": [...], "names": [...], "sizes": [...]}, ascending by time
+        self.total_bytes = 0
+        self.total_frames = 0
+        self.evicted_frames = 0
+        self.evicted_bytes = 0
+        self.refreshed = 0
+        self.refresh()
+
+    def refresh(self):
+        prints = dict()
+        if os.path.isdir(self.folder):
+            for folder in os.scandir(self.folder):
+                if not folder.is_dir(): continue
+                frames = sorted((get_frame_time(entry), entry.name, entry.stat().st_size) for entry in os.scandir(folder.path) if entry.name.endswith(FRAME_FORMAT) and entry.is_file())
+                if frames:
+                    prints[folder.name] = {"times": [frame[0] for frame in frames], "names": [frame[1] for frame in frames], "sizes": [frame[2] for frame in frames]}
+        with self.lock:
+            self.prints = prints
+            self.total_bytes = sum(sum(frames["sizes"]) for frames in prints.values())
+            self.total_frames = sum(len(frames["names"]) for frames in prints.values())
+            self.refreshed = time.monotonic()
+
+    def refresh_if_stale(self):
+        if time.monotonic() - self.refreshed >= REFRESH_INTERVAL:
+            self.refresh()
+
+    def add_frame(self, print_name: str, file_name: str, size: int, timestamp=None):
+        self.refresh_if_stale()
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        with self.lock:
+            frames = self.prints.setdefault(print_name, {"times": list(), "names": list(), "sizes": list()})
+            index = bisect.bisect_right(frames["times"], timestamp)
+            frames["times"].insert(index, timestamp)
+            frames["names"].insert(index, file_name)
+            frames["sizes"].insert(index, size)
+            self.total_frames += 1
+            self.total_bytes += size
+        self.enforce_budget()
+
+    def select_evictions(self, excess: int):
+        # Repeatedly drop the frame whose removal leaves the smallest gap relative to its age, so every print keeps
+        # evenly spaced frames and the spacing widens with age. The first and the newest protect_frames stay.
+        now = time.time()
+        heap = list()
+        links = dict()    # print -> (prev, next, version) lists over frame indexes
+        def get_score(print_name, index):
+            prev, next, _ = links[print_name]
+            times = self.prints[print_name]["times"]
+            return (times[next[index]] - times[prev[index]]) / max(1, now - times[index])
+        
+        for print_name, frames in self.prints.items():
+            count = len(frames["names"])
+            links[print_name] = (list(range(-1, count - 1)), list(range(1, count + 1)), [0] * count)
+            # The newest frame always stays, so every candidate has a later neighbour
+            for index in range(1, count - max(1, self.protect_frames)):
+                heap.append((get_score(print_name, index), 0, print_name, index))
+        heapq.heapify(heap)
+        
+        removals = dict()
+        while excess > 0 and heap:
+            _, version, print_name, index = heapq.heappop(heap)
+            prev, next, versions = links[print_name]
+            if version != versions[index]: continue
+            versions[index] = -1
+            removals.setdefault(print_name, set()).add(self.prints[print_name]["names"][index])
+            excess -= self.prints[print_name]["sizes"][index]
+            prev[next[index]], next[prev[index]] = prev[index], next[index]
+            for neighbor in (prev[index], next[index]):
+                if neighbor < 1 or neighbor >= len(versions) - max(1, self.protect_frames) or versions[neighbor] < 0: continue
+                versions[neighbor] += 1
+                heapq.heappush(heap, (get_score(print_name, neighbor), versions[neighbor], print_name, neighbor))
+        return removals
+
+    def remove_frames(self, removals: dict):
+        # removals: print -> set of frame names; each print's index is rebuilt once
+        for print_name, names in removals.items():
+            frames = self.prints[print_name]
+            kept = {"times": list(), "names": list(), "sizes": list()}
+            for timestamp, name, size in zip(frames["times"], frames["names"], frames["sizes"]):
+                if name not in names:
+                    kept["times"].append(timestamp); kept["names"].append(name); kept["sizes"].append(size)
+                    continue
+                try:
+                    os.remove(os.path.join(self.folder, print_name, name))
+                except FileNotFoundError:
+                    pass
+                self.total_bytes -= size
+                self.total_frames -= 1
+                self.evicted_frames += 1
+                self.evicted_bytes += size
+            self.prints[print_name] = kept
+
+    def enforce_budget(self):
+        if self.max_bytes is None: return
+        with self.lock:
+            if self.total_bytes <= self.max_bytes: return
+            self.remove_frames(self.select_evictions(self.total_bytes - int(self.max_bytes * LOW_WATER)))
+            if self.total_bytes > self.max_bytes:
+                print(f"FrameStore: {self.total_bytes} bytes over the {self.max_bytes} byte budget, nothing left to thin")
+
+    def get_usage(self):
+        self.refresh_if_stale()
+        with self.lock:
+            return {
+                "bytes": self.total_bytes,
+                "budget": self.max_bytes,
+                "usage": round(self.total_bytes / self.max_bytes, 4) if self.max_bytes else None,
+                "frames": self.total_frames,
+                "prints": len(self.prints),
+                "evicted_frames": self.evicted_frames,
+                "evicted_bytes": self.evicted_bytes
+            }
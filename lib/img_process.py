@@ -1,80 +1,216 @@
-import cv2, os, shutil, zipfile
+import cv2, os, io, heapq, zipfile
 import numpy as np
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 
-def analyze_dlp_slice_image(image_path):
-    #print(f"analyze_dlp_slice_image: {image_path}")
-    # img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+# Part of the analysis cache key: changing either invalidates cached layer results
+ANALYSIS_THRESHOLD = 127
+ANALYSIS_CONNECTIVITY = 8
+
+def read_grayscale_image(image_path):
     with open(image_path, 'rb') as f:
         bytes_data = f.read()
     np_array = np.frombuffer(bytes_data, np.uint8)
-    img = cv2.imdecode(np_array, cv2.IMREAD_GRAYSCALE)
+    return cv2.imdecode(np_array, cv2.IMREAD_GRAYSCALE)
+
+def analyze_dlp_slice_image(image_path, as_array=False, memory_budget=None):
+    #print(f"analyze_dlp_slice_image: {image_path}")
+    # img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    img = read_grayscale_image(image_path)
     if img is None:
         print(f"Error: No such file in directory / Path: {image_path}")
         return False
 
-    _, binary_img = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
+    # Full-image labelling needs an int32 label matrix (4 bytes/pixel) on top of the image itself
+    if memory_budget is not None and img.size * 5 > memory_budget:
+        return analyze_binary_image_tiled(img, memory_budget, as_array)
+
+    # Threshold in place: no second full-size image
+    cv2.threshold(img, ANALYSIS_THRESHOLD, 255, cv2.THRESH_BINARY, dst=img)
     
-    total_white_pixels = int(np.sum(binary_img == 255))
+    total_white_pixels = int(cv2.countNonZero(img))
     
     num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(
-        binary_img, 
-        connectivity=8,  # 8방향 연결성 (대각선 포함)
+        img, 
+        connectivity=ANALYSIS_CONNECTIVITY,  # 8방향 연결성 (대각선 포함)
         ltype=cv2.CV_32S
     )
     
-    blob_sizes = list()
-
-    for i in range(1, num_labels): 
-        area = stats[i, cv2.CC_STAT_AREA] 
-        blob_sizes.append(int(area))
-        
-    blob_sizes.sort()
+    # Row 0 is the background; areas come straight from the stats column
+    blob_sizes = np.sort(stats[1:, cv2.CC_STAT_AREA]).astype(np.uint32)
     
-    return {"total": total_white_pixels, "blob": {"count": len(blob_sizes), "sizes": blob_sizes}}
+    return {"total": total_white_pixels, "blob": {"count": int(blob_sizes.size), "sizes": blob_sizes if as_array else blob_sizes.tolist()}}
 
-def create_preview_zip(src_folder, output_file):
-    if os.path.exists(os.path.join(src_folder, "preview_temp")): shutil.rmtree(os.path.join(src_folder, "preview_temp"))
-    os.makedirs(os.path.join(src_folder, "preview_temp"))
-    
-    images = [img for img in os.listdir(src_folder) if img.endswith((".jpg", ".png", ".jpeg", ".webp"))]
-    images.sort()
+def get_strip_rows(width: int, height: int, memory_budget: int):
+    # Rows per strip so that image + strip labels (int32) stay within the budget; the decoded image is the floor
+    available = memory_budget - width * height
+    return int(min(height, max(1, available // (width * 4))))
+
+def find_root(parent: list, label: int):
+    while parent[label] != label:
+        parent[label] = parent[parent[label]]
+        label = parent[label]
+    return label
+
+def analyze_binary_image_tiled(img, memory_budget: int, as_array=False):
+    # Label horizontal strips one at a time and merge blobs that touch across strip boundaries with union-find.
+    # Only one strip's label matrix is alive at a time; results are identical to the full-image path.
+    height, width = img.shape
+    rows = get_strip_rows(width, height, memory_budget)
+    cv2.threshold(img, ANALYSIS_THRESHOLD, 255, cv2.THRESH_BINARY, dst=img)
+    total_white_pixels = int(cv2.countNonZero(img))
+
+    areas = list()
+    parent = list()
+    previous_row = None
+    for top in range(0, height, rows):
+        num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(
+            img[top:top + rows],
+            connectivity=ANALYSIS_CONNECTIVITY,
+            ltype=cv2.CV_32S
+        )
+        offset = len(areas) - 1
+        areas.extend(stats[1:, cv2.CC_STAT_AREA].tolist())
+        parent.extend(range(offset + 1, offset + num_labels))
+
+        # Global ids for the boundary rows; -1 is background
+        first_row = np.where(labels[0] > 0, labels[0].astype(np.int64) + offset, -1)
+        if previous_row is not None:
+            pairs = [np.stack((previous_row, first_row), axis=1)]
+            if ANALYSIS_CONNECTIVITY == 8:
+                pairs.append(np.stack((previous_row[:-1], first_row[1:]), axis=1))
+                pairs.append(np.stack((previous_row[1:], first_row[:-1]), axis=1))
+            pairs = np.concatenate(pairs)
+            pairs = np.unique(pairs[(pairs[:, 0] >= 0) & (pairs[:, 1] >= 0)], axis=0)
+            for upper, lower in pairs.tolist():
+                upper, lower = find_root(parent, upper), find_root(parent, lower)
+                if upper != lower:
+                    parent[max(upper, lower)] = min(upper, lower)
+        last = labels[-1]
+        previous_row = np.where(last > 0, last.astype(np.int64) + offset, -1)
+        del labels, stats, centroids
+
+    if len(areas) == 0:
+        blob_sizes = np.zeros(0, np.uint32)
+    else:
+        roots = np.array([find_root(parent, label) for label in range(len(parent))], np.int64)
+        merged = np.bincount(roots, weights=np.array(areas, np.float64), minlength=len(areas))
+        blob_sizes = np.sort(merged[roots == np.arange(len(roots))].astype(np.int64)).astype(np.uint32)
+
+    return {"total": total_white_pixels, "blob": {"count": int(blob_sizes.size), "sizes": blob_sizes if as_array else blob_sizes.tolist()}}
+
+def to_json_result(result):
+    # Convert an as_array=True result into the JSON-ready form
+    if result is False or isinstance(result["blob"]["sizes"], list):
+        return result
+    return {"total": result["total"], "blob": {"count": result["blob"]["count"], "sizes": result["blob"]["sizes"].tolist()}}
+
+SMALL_BLOB_PIXELS = 10
+
+def get_percentile(sizes, percent: float):
+    # Nearest-rank percentile of an ascending array
+    if sizes.size == 0: return 0
+    rank = max(1, int(np.ceil(percent / 100 * sizes.size)))
+    return int(sizes[rank - 1])
+
+def summarize_blob_sizes(sizes, small_blob=SMALL_BLOB_PIXELS):
+    # Compact replacement for a full sorted size list: quantiles, small-island count and a log2 histogram
+    # (histogram[i] = blobs with 2**i <= size < 2**(i+1))
+    sizes = np.sort(np.asarray(sizes, dtype=np.int64))
+    histogram = np.bincount(np.floor(np.log2(sizes)).astype(np.int64)).tolist() if sizes.size > 0 else []
+    return {
+        "min": int(sizes[0]) if sizes.size > 0 else 0,
+        "p50": get_percentile(sizes, 50),
+        "p99": get_percentile(sizes, 99),
+        "max": int(sizes[-1]) if sizes.size > 0 else 0,
+        "small": int(np.searchsorted(sizes, small_blob, side="left")),
+        "small-threshold": small_blob,
+        "histogram": histogram
+    }
+
+def to_summary_result(result, small_blob=SMALL_BLOB_PIXELS):
+    if result is False:
+        return result
+    return {"total": result["total"], "blob": {"count": result["blob"]["count"], "summary": summarize_blob_sizes(result["blob"]["sizes"], small_blob)}}
+
+def count_white_pixels(image_path):
+    # Same white-pixel definition as analyze_dlp_slice_image, without the connected-component pass
+    img = read_grayscale_image(image_path)
+    if img is None:
+        print(f"Error: No such file in directory / Path: {image_path}")
+        return None
+    cv2.threshold(img, ANALYSIS_THRESHOLD, 255, cv2.THRESH_BINARY, dst=img)
+    return int(cv2.countNonZero(img))
+
+FRAME_FORMAT = (".jpg", ".png", ".jpeg", ".webp")
+PREVIEW_FRAMES = 30
+
+def get_latest_frames(src_folder, count):
+    # Frame names sort by capture time; heapq keeps only the newest `count` instead of sorting the whole folder
+    names = (entry.name for entry in os.scandir(src_folder) if entry.name.endswith(FRAME_FORMAT) and entry.is_file())
+    return sorted(heapq.nlargest(count, names))
+
+def create_preview_zip(src_folder, output_file=None, frames=PREVIEW_FRAMES):
+    # Archive built in memory straight from the frame files. WEBP/JPEG are already compressed, so ZIP_STORED.
+    # Returns the archive rewound to the start, ready to be streamed; output_file additionally writes <output_file>.zip
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zipf:
+        for filename in get_latest_frames(src_folder, frames):
+            zipf.write(os.path.join(src_folder, filename), filename)
     
-    files_to_zip = images[-30:]
+    if output_file is not None:
+        with open(f"{output_file}.zip", 'wb') as f:
+            f.write(buffer.getbuffer())
+    buffer.seek(0)
+    return buffer
     
-    for filename in files_to_zip:
-        src_path = os.path.join(src_folder, filename)
-        dst_path = os.path.join(src_folder, "preview_temp", filename)
-        shutil.copy2(src_path, dst_path) # 파일 복사 (메타데이터 포함)
+def get_frame_names(src_folder):
+    return sorted(entry.name for entry in os.scandir(src_folder) if entry.name.endswith(FRAME_FORMAT) and entry.is_file())
+
+def decode_frame(image_path, size=None):
+    # Runs on the decoder threads (imread/resize release the GIL); resized here, once, to the video size
+    image = cv2.imread(image_path)
+    if image is not None and size is not None and (image.shape[1], image.shape[0]) != size:
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return image
+
+def iter_decoded_frames(paths, size=None, workers=None, prefetch=None):
+    # In-order frames from a decoder pool; at most `prefetch` decoded frames wait for the encoder
+    workers = workers or max(1, (os.cpu_count() or 1))
+    prefetch = prefetch or workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        remaining = iter(paths)
+        for path in remaining:
+            pending.append(executor.submit(decode_frame, path, size))
+            if len(pending) >= prefetch: break
         
-    with zipfile.ZipFile(f"{output_file}.zip", 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(os.path.join(src_folder, "preview_temp")):
-            for file in files:
-                file_path = os.path.join(root, file)
-                zipf.write(file_path, os.path.relpath(file_path, os.path.join(src_folder, "preview_temp")))
-                
-    shutil.rmtree(os.path.join(src_folder, "preview_temp"))
-    
-def create_timelapse(src_folder, output_file, fps):
-    
-    images = [img for img in os.listdir(src_folder) if img.endswith((".jpg", ".png", ".jpeg", ".webp"))]
-    images.sort()
+        while pending:
+            image = pending.popleft().result()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append(executor.submit(decode_frame, next_path, size))
+            yield image
+
+def create_timelapse(src_folder, output_file, fps, size=None, step=1, workers=None, prefetch=None):
+    # size: (width, height) of the video (None: first frame's size); step: keep every step-th frame
+    images = get_frame_names(src_folder)[::max(1, step)]
     
     if not images:
         print(f"Error: No images found in {src_folder}")
         return
 
-    first_image_path = os.path.join(src_folder, images[0])
-    frame = cv2.imread(first_image_path)
-    height, width, layers = frame.shape
+    if size is None:
+        frame = cv2.imread(os.path.join(src_folder, images[0]))
+        height, width, layers = frame.shape
+        size = (width, height)
 
     fourcc = cv2.VideoWriter_fourcc(*'mp4v') # XVID, MJPG ...
-    video = cv2.VideoWriter(output_file, fourcc, fps, (width, height))
+    video = cv2.VideoWriter(output_file, fourcc, fps, size)
     
-    for image_name in images:
-        image_path = os.path.join(src_folder, image_name)
-        image = cv2.imread(image_path)
-        video.write(image)
+    # Decoding the next frames overlaps with encoding the current one
+    for image in iter_decoded_frames([os.path.join(src_folder, image_name) for image_name in images], size=size, workers=workers, prefetch=prefetch):
+        if image is not None:
+            video.write(image)
 
     video.release()
-    cv2.destroyAllWindows()
\ No newline at end of file
@@ -1,37 +1,246 @@
-import json, time, os
+import json, time, os, threading, gzip, lzma
+
+SEGMENT_FORMAT = "columnar-log"
+SEGMENT_VERSION = 1
+SEGMENT_EXTENSIONS = {"gzip": ".seg.gz", "lzma": ".seg.xz"}
+SEGMENT_CONTENT_TYPES = {"gzip": "application/gzip", "lzma": "application/x-xz"}
+INDEX_FILE = "device-log-index.json"
+INDEX_STRIDE = 60
+MISSING = object()
+
+def convert_jsonl_to_log(file: str):
+    # Rebuild the {"device":..., "data":[...]} upload document from an append-only log
+    log_dic = {"device": dict(), "data": list()}
+    with open(file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line after a power cut; everything before it is intact
+                continue
+            if "timestamp" not in record and "device" in record:
+                log_dic["device"] = record["device"]
+            else:
+                log_dic["data"].append(record)
+    return log_dic
+
+def flatten_record(record, prefix=()):
+    # Leaves are every non-dict value plus empty dicts, addressed by their key path
+    if isinstance(record, dict) and record:
+        leaves = list()
+        for key, value in record.items():
+            leaves.extend(flatten_record(value, prefix + (key,)))
+        return leaves
+    return [(prefix, record)]
+
+def set_path(record: dict, path: list, value):
+    for key in path[:-1]:
+        record = record.setdefault(key, dict())
+    record[path[-1]] = value
+
+def encode_runs(values: list):
+    runs = list()
+    for value in values:
+        if runs and runs[-1][0] == value and type(runs[-1][0]) == type(value):
+            runs[-1][1] += 1
+        else:
+            runs.append([value, 1])
+    return runs
+
+def decode_runs(runs: list):
+    values = list()
+    for value, count in runs:
+        values.extend([value] * count)
+    return values
+
+def encode_column(path: tuple, values: list):
+    column = {"path": list(path)}
+    present = [value is not MISSING for value in values]
+    if not all(present):
+        column["present"] = encode_runs(present)
+    values = [value for value in values if value is not MISSING]
+
+    # Counters and timestamps: store first value + differences so steady increments collapse into one run
+    if values and all(type(value) is int for value in values):
+        deltas = [values[0]] + [values[i] - values[i - 1] for i in range(1, len(values))]
+        column["encoding"] = "delta"
+        column["data"] = encode_runs(deltas)
+    else:
+        column["encoding"] = "rle"
+        column["data"] = encode_runs(values)
+    return column
+
+def decode_column(column: dict, count: int):
+    values = decode_runs(column["data"])
+    if column["encoding"] == "delta":
+        for i in range(1, len(values)):
+            values[i] += values[i - 1]
+    if "present" not in column:
+        return values
+    values = iter(values)
+    return [next(values) if present else MISSING for present in decode_runs(column["present"])]
+
+def encode_log_segment(records: list, device: dict):
+    paths = dict()
+    for row, record in enumerate(records):
+        for path, value in flatten_record(record):
+            if path not in paths:
+                paths[path] = [MISSING] * row
+            paths[path].append(value)
+        for values in paths.values():
+            if len(values) <= row:
+                values.append(MISSING)
+    return {
+        "format": SEGMENT_FORMAT,
+        "version": SEGMENT_VERSION,
+        "device": device,
+        "count": len(records),
+        "columns": [encode_column(path, values) for path, values in paths.items()]
+    }
+
+def parse_fields(fields):
+    # fields: optional list of "/"-separated path prefixes, e.g. ["sensor/temperature", "print/current-layer"]
+    return None if fields is None else [tuple(field.strip("/").split("/")) for field in fields]
+
+def match_fields(path: tuple, prefixes):
+    if prefixes is None or path == ("timestamp",): return True
+    return any(path[:len(prefix)] == prefix for prefix in prefixes)
+
+def select_fields(record: dict, prefixes):
+    if prefixes is None: return record
+    selected = dict()
+    for path, value in flatten_record(record):
+        if path and match_fields(path, prefixes):
+            set_path(selected, list(path), value)
+    return selected
+
+def decode_log_segment(segment: dict, fields=None):
+    # Columns outside `fields` are never decoded
+    prefixes = parse_fields(fields)
+    count = segment["count"]
+    records = [dict() for _ in range(count)]
+    for column in segment["columns"]:
+        path = tuple(column["path"])
+        if not match_fields(path, prefixes):
+            continue
+        for record, value in zip(records, decode_column(column, count)):
+            if value is MISSING: continue
+            if not path:
+                record.update(value)
+            else:
+                set_path(record, list(path), value)
+    return records
+
+def open_segment(file: str, mode: str, name=None):
+    # name: the segment name that decides the compression when file is a temporary path
+    if (name or file).endswith(SEGMENT_EXTENSIONS["lzma"]):
+        return lzma.open(file, mode)
+    return gzip.open(file, mode)
+
+def write_log_segment(file: str, records: list, device: dict):
+    temp_file = f"{file}.tmp"
+    with open_segment(temp_file, 'wt', name=file) as f:
+        json.dump(encode_log_segment(records, device), f, ensure_ascii=False, separators=(',', ':'))
+    with open(temp_file, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(temp_file, file)
+    return file
+
+def read_log_segment(file: str, fields=None):
+    with open_segment(file, 'rt') as f:
+        segment = json.load(f)
+    return segment["device"], decode_log_segment(segment, fields)
+
+def convert_segment_to_log(file: str):
+    device, records = read_log_segment(file)
+    return {"device": device, "data": records}
+
+def is_segment_file(file: str):
+    return file.endswith(tuple(SEGMENT_EXTENSIONS.values()))
+
+def get_segment_content_type(file: str):
+    # Segments are uploaded as they are stored; the content type tells the server how to unpack them
+    return SEGMENT_CONTENT_TYPES["lzma"] if file.endswith(SEGMENT_EXTENSIONS["lzma"]) else SEGMENT_CONTENT_TYPES["gzip"]
+
+def get_segment_source(file: str):
+    for extension in SEGMENT_EXTENSIONS.values():
+        if file.endswith(extension):
+            return file.removesuffix(extension) + ".jsonl"
+    return None
+
+class LogWriter:
+    def __init__(self, file: str, sync_entries=10, sync_interval=10):
+        self.file = file
+        self.sync_entries = sync_entries
+        self.sync_interval = sync_interval
+        
+        self.stream = open(file, 'a', encoding='utf-8')
+        self.entries = 0
+        self.size = self.stream.tell()
+        self.created = time.time()
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        
+        # Sparse time index: [timestamp, byte offset] of every INDEX_STRIDE-th record
+        self.start = None
+        self.end = None
+        self.offsets = list()
+        
+    def write_record(self, data: dict):
+        line = json.dumps(data, ensure_ascii=False, separators=(',', ':')) + "\n"
+        self.stream.write(line)
+        self.size += len(line.encode('utf-8'))
+        self.pending += 1
+        
+    def append(self, data: dict):
+        timestamp = data.get("timestamp")
+        if timestamp is not None:
+            if self.entries % INDEX_STRIDE == 0:
+                self.offsets.append([timestamp, self.size])
+            if self.start is None: self.start = timestamp
+            self.end = timestamp
+        self.write_record(data)
+        self.entries += 1
+        if self.pending >= self.sync_entries or time.monotonic() - self.last_sync >= self.sync_interval:
+            self.sync()
+        
+    def sync(self):
+        # One fsync per batch instead of one full-file rewrite per record
+        self.stream.flush()
+        os.fsync(self.stream.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        
+    def close(self):
+        if self.stream.closed: return
+        self.sync()
+        self.stream.close()
+        
+    def get_index_entry(self):
+        return {"format": "jsonl", "start": self.start, "end": self.end, "count": self.entries, "offsets": self.offsets}
 
 class LogManager:
-    def __init__(self, device_type, device_number, log_folder):
+    def __init__(self, device_type, device_number, log_folder, max_entries=3600, max_bytes=None, max_age=None, sync_entries=10, sync_interval=10, segment="gzip"):
         self.device_type = device_type
         self.device_number = device_number
         self.log_folder = log_folder
+        
+        # Rotation policy: a log file is closed when any configured limit is reached
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sync_entries = sync_entries
+        self.sync_interval = sync_interval
+        # Rotated JSONL files are compacted into columnar segments ("gzip" / "lzma"); None keeps the JSONL
+        self.segment = segment
+        
+        self.log_writer = None
+        self.log_lock = threading.Lock()
+        self.log_index = None
+        self.compactions = list()
     
-    def create_log_file(self):
-        filename = f"{self.device_type}-{self.device_number}-{int(time.time())}.json"
-        empty_dic = {
-            "device":{
-                "type": self.device_type,
-                "number": self.device_number
-            },
-            "data": list()
-        }
-        with open(os.path.join(self.log_folder, filename), 'w', encoding='utf-8') as log_file:
-            json.dump(empty_dic, log_file, indent=4) 
-            
-        return os.path.join(self.log_folder, filename)
-    
-    def update_log_file(self, file, data):
-        current_data = {}
-        with open(file, 'r', encoding='utf-8') as f:
-            current_data = json.load(f)
-            
-        if "data" in current_data and isinstance(current_data["data"], list):
-            current_data["data"].append(data)
-        else: return False
-
-        with open(file, 'w', encoding='utf-8') as f:
-            json.dump(current_data, f, ensure_ascii=False, indent=4)
-
     def save_log_file(self, file: str):
         with open(os.path.join(self.log_folder, "device-log.json"), 'r', encoding='utf-8') as f:
             device_log = json.load(f)
@@ -39,4 +248,190 @@ class LogManager:
         device_log["updated-list"].append(os.path.basename(file))
 
         with open(os.path.join(self.log_folder, "device-log.json"), 'w', encoding='utf-8') as f:
-            json.dump(device_log, f, ensure_ascii=False, indent=4)
\ No newline at end of file
+            json.dump(device_log, f, ensure_ascii=False, indent=4)
+
+    def open_log_writer(self):
+        timestamp = int(time.time())
+        # Size-based rotation can close a file within the same second; never append to a closed log
+        while any(os.path.exists(os.path.join(self.log_folder, f"{self.device_type}-{self.device_number}-{timestamp}{extension}")) for extension in (".jsonl", *SEGMENT_EXTENSIONS.values())):
+            timestamp += 1
+        filename = f"{self.device_type}-{self.device_number}-{timestamp}.jsonl"
+        writer = LogWriter(os.path.join(self.log_folder, filename), sync_entries=self.sync_entries, sync_interval=self.sync_interval)
+        writer.write_record({
+            "device":{
+                "type": self.device_type,
+                "number": self.device_number
+            }
+        })
+        writer.sync()
+        return writer
+    
+    def should_rotate(self, writer: LogWriter):
+        if self.max_entries is not None and writer.entries >= self.max_entries: return True
+        if self.max_bytes is not None and writer.size >= self.max_bytes: return True
+        if self.max_age is not None and time.time() - writer.created >= self.max_age: return True
+        return False
+    
+    def append_log(self, data: dict):
+        with self.log_lock:
+            if self.log_writer is None:
+                self.log_writer = self.open_log_writer()
+            self.log_writer.append(data)
+            if self.should_rotate(self.log_writer):
+                self.rotate_log()
+    
+    def rotate_log(self):
+        print("=========================================================\n=========================================================\nDEVICE LOG: SAVE AND UPDATE!!!!\n=========================================================\n=========================================================\n")
+        writer = self.log_writer
+        self.log_writer = None
+        writer.close()
+        self.update_index(os.path.basename(writer.file), writer.get_index_entry())
+        if self.segment is None:
+            self.save_log_file(file=writer.file)
+            return
+        # Compaction reads the whole file back; it runs beside the status tick instead of holding log_lock
+        self.compactions = [thread for thread in self.compactions if thread.is_alive()]
+        thread = threading.Thread(target=self.compact_rotated_log, args=(writer,))
+        thread.start()
+        self.compactions.append(thread)
+    
+    def compact_rotated_log(self, writer: LogWriter):
+        file = writer.file
+        try:
+            file = self.compact_log_file(writer.file)
+        except Exception as e:
+            print(f"Exception in compact_log_file ->{writer.file}: {e}")
+        with self.log_lock:
+            if file != writer.file:
+                self.update_index(os.path.basename(file), {"format": "segment", "start": writer.start, "end": writer.end, "count": writer.entries})
+                self.update_index(os.path.basename(writer.file), None)
+                os.remove(writer.file)
+            self.save_log_file(file=file)
+    
+    def compact_log_file(self, file: str):
+        # Writes the segment next to the JSONL; the caller swaps them in the index and removes the JSONL
+        log_dic = convert_jsonl_to_log(file)
+        segment_file = file.removesuffix(".jsonl") + SEGMENT_EXTENSIONS[self.segment]
+        write_log_segment(segment_file, log_dic["data"], log_dic["device"])
+        return segment_file
+    
+    def close_log(self):
+        for thread in self.compactions:
+            thread.join()
+        with self.log_lock:
+            if self.log_writer is not None:
+                self.log_writer.close()
+                self.update_index(os.path.basename(self.log_writer.file), self.log_writer.get_index_entry())
+                # The closed file stays indexed; a later append opens a new one
+                self.log_writer = None
+    
+    def get_log_index(self):
+        if self.log_index is None:
+            try:
+                with open(os.path.join(self.log_folder, INDEX_FILE), 'r', encoding='utf-8') as f:
+                    self.log_index = json.load(f)
+            except Exception:
+                self.log_index = {"files": dict()}
+        return self.log_index
+    
+    def save_log_index(self):
+        temp_file = os.path.join(self.log_folder, f"{INDEX_FILE}.tmp")
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.log_index, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_file, os.path.join(self.log_folder, INDEX_FILE))
+    
+    def update_index(self, file: str, entry):
+        index = self.get_log_index()
+        if entry is None:
+            if index["files"].pop(file, None) is None: return
+        else:
+            index["files"][file] = entry
+        self.save_log_index()
+    
+    def build_index_entry(self, file: str):
+        # Files left unindexed by a crash: index them once by scanning
+        path = os.path.join(self.log_folder, file)
+        if is_segment_file(file):
+            _, records = read_log_segment(path, fields=[])
+            timestamps = [record["timestamp"] for record in records if "timestamp" in record]
+            return {"format": "segment", "start": min(timestamps, default=None), "end": max(timestamps, default=None), "count": len(records)}
+        
+        entry = {"format": "jsonl", "start": None, "end": None, "count": 0, "offsets": list()}
+        with open(path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = dict()
+                timestamp = record.get("timestamp")
+                if timestamp is not None:
+                    if entry["count"] % INDEX_STRIDE == 0:
+                        entry["offsets"].append([timestamp, offset])
+                    if entry["start"] is None: entry["start"] = timestamp
+                    entry["end"] = timestamp
+                    entry["count"] += 1
+                offset += len(line)
+        return entry
+    
+    def get_index_entries(self):
+        index = self.get_log_index()
+        active = os.path.basename(self.log_writer.file) if self.log_writer is not None else None
+        changed = False
+        for file in os.listdir(self.log_folder):
+            if file == active or file in index["files"]: continue
+            # Compaction still running: the JSONL stays the indexed copy until the segment replaces it
+            if is_segment_file(file) and os.path.exists(os.path.join(self.log_folder, get_segment_source(file))): continue
+            if file.endswith(".jsonl") or is_segment_file(file):
+                index["files"][file] = self.build_index_entry(file)
+                changed = True
+        for file in [file for file in index["files"] if not os.path.exists(os.path.join(self.log_folder, file))]:
+            index["files"].pop(file)
+            changed = True
+        if changed: self.save_log_index()
+        
+        entries = dict(index["files"])
+        if self.log_writer is not None:
+            # Make buffered records of the open file visible to the reader (no fsync needed)
+            self.log_writer.stream.flush()
+            entries[active] = self.log_writer.get_index_entry()
+        return entries
+    
+    def read_jsonl_range(self, file: str, entry: dict, start, end, prefixes):
+        offset = 0
+        for timestamp, position in entry.get("offsets", []):
+            if timestamp <= start: offset = position
+            else: break
+        
+        records = list()
+        with open(os.path.join(self.log_folder, file), 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                timestamp = record.get("timestamp")
+                if timestamp is None or timestamp < start: continue
+                if timestamp > end: break
+                records.append(select_fields(record, prefixes))
+        return records
+    
+    def query(self, start, end, fields=None):
+        # Records with start <= timestamp <= end, optionally projected to the given "/"-separated field paths
+        prefixes = parse_fields(fields)
+        with self.log_lock:
+            entries = self.get_index_entries()
+            
+        records = list()
+        for file, entry in sorted(entries.items(), key=lambda item: item[1]["start"] if item[1]["start"] is not None else 0):
+            if entry["start"] is None or entry["end"] < start or entry["start"] > end: continue
+            try:
+                if entry["format"] == "segment":
+                    _, segment_records = read_log_segment(os.path.join(self.log_folder, file), fields=fields)
+                    records.extend(record for record in segment_records if start <= record.get("timestamp", start - 1) <= end)
+                else:
+                    records.extend(self.read_jsonl_range(file, entry, start, end, prefixes))
+            except Exception as e:
+                print(f"Exception in query ->{file}: {e}")
+        return records
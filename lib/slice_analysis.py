@@ -0,0 +1,228 @@
+import os, json, time, multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from . import img_process
+
+# Below this many layers the pool start-up costs more than it saves
+PARALLEL_MIN_LAYERS = 16
+
+# One cache per slice folder in a separate cache folder: per-layer results keyed by (mtime, size) and the analysis
+# parameters. Nothing is written into the slice folder, whose changes the data scanner reports.
+#   <slice>.json   compacted cache, rewritten once at the end of an analysis
+#   <slice>.jsonl  journal: a params line, then one [name, signature, result] line per newly analysed layer
+ANALYSIS_CACHE_FOLDER = "analysis-cache"
+ANALYSIS_CACHE_VERSION = 2
+# The journal is fsynced this often so an interrupted analysis resumes where it stopped
+CHECKPOINT_LAYERS = 50
+
+def get_slice_images(folder: str):
+    # SEC_0001.png, SEC_0002.png, ... up to the first missing layer (same rule as the serial loop)
+    names = list(); i = 1
+    while os.path.exists(os.path.join(folder, f"SEC_{i:04d}.png")):
+        names.append(f"SEC_{i:04d}.png")
+        i += 1
+    return names
+
+def get_worker_count(workers=None):
+    if workers is not None and workers > 0:
+        return workers
+    return max(1, (os.cpu_count() or 1))
+
+def report_progress(progress, done: int, total: int, started: float):
+    if progress is None: return
+    elapsed = time.monotonic() - started
+    progress({
+        "done": done,
+        "total": total,
+        "elapsed": round(elapsed, 3),
+        "rate": round(done / elapsed, 2) if elapsed > 0 else 0
+    })
+
+def get_analysis_params(store=None):
+    # store: what the cached results were reduced to, so results kept for another blob mode are not reused
+    return {
+        "version": ANALYSIS_CACHE_VERSION,
+        "threshold": img_process.ANALYSIS_THRESHOLD,
+        "connectivity": img_process.ANALYSIS_CONNECTIVITY,
+        "store": store
+    }
+
+def get_analysis_cache_path(cache_folder: str, folder: str):
+    return os.path.join(cache_folder, f"{os.path.basename(os.path.normpath(folder))}.json")
+
+def get_layer_signature(folder: str, name: str):
+    stat = os.stat(os.path.join(folder, name))
+    return [stat.st_mtime_ns, stat.st_size]
+
+def get_analysis_journal_path(cache_file: str):
+    return cache_file.removesuffix(".json") + ".jsonl"
+
+def load_analysis_cache(cache_file: str, store=None):
+    # The compacted cache plus the layers journaled after it (a torn last line is skipped)
+    params = get_analysis_params(store)
+    cache = {"params": params, "layers": dict()}
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            loaded = json.load(f)
+        if loaded.get("params") == params:
+            cache = loaded
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"load_analysis_cache error ->{cache_file}: {e}")
+
+    journal_file = get_analysis_journal_path(cache_file)
+    try:
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            if json.loads(f.readline() or "null") != {"params": params}:
+                raise ValueError("journal written with other analysis parameters")
+            for line in f:
+                try:
+                    name, signature, result = json.loads(line)
+                except ValueError:
+                    continue
+                cache["layers"][name] = [signature, result]
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"load_analysis_cache journal ->{journal_file}: {e}")
+        os.remove(journal_file)
+    return cache
+
+def save_analysis_cache(cache_file: str, cache: dict):
+    # Compaction: the whole cache once, then the journal it absorbed is dropped
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temp_file = f"{cache_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, separators=(',', ':'))
+        os.replace(temp_file, cache_file)
+        if os.path.exists(get_analysis_journal_path(cache_file)):
+            os.remove(get_analysis_journal_path(cache_file))
+    except Exception as e:
+        print(f"save_analysis_cache error ->{cache_file}: {e}")
+
+def remove_analysis_cache(cache_folder: str, folder: str):
+    cache_file = get_analysis_cache_path(cache_folder, folder)
+    for file in (cache_file, get_analysis_journal_path(cache_file)):
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+
+class AnalysisJournal:
+    # Appends one line per analysed layer; each line is written once, so writes stay linear in the job size
+    def __init__(self, cache_file: str, params: dict):
+        self.file = get_analysis_journal_path(cache_file)
+        self.params = params
+        self.stream = None
+        self.pending = 0
+
+    def append(self, name: str, signature: list, result):
+        if self.stream is None:
+            os.makedirs(os.path.dirname(self.file), exist_ok=True)
+            self.stream = open(self.file, 'a', encoding='utf-8')
+            if self.stream.tell() == 0:
+                self.stream.write(json.dumps({"params": self.params}, separators=(',', ':')) + "\n")
+        self.stream.write(json.dumps([name, signature, result], separators=(',', ':')) + "\n")
+        self.pending += 1
+        if self.pending >= CHECKPOINT_LAYERS:
+            self.sync()
+
+    def sync(self):
+        self.stream.flush()
+        os.fsync(self.stream.fileno())
+        self.pending = 0
+
+    def close(self):
+        if self.stream is None: return
+        self.sync()
+        self.stream.close()
+        self.stream = None
+
+def analyze_slices_cached(folder: str, cache_folder: str, names=None, workers=None, max_pending=None, progress=None, memory_budget=None, reduce=None, store=None):
+    # Same output as analyze_slices, but layers whose PNG is unchanged are served from the cache in cache_folder.
+    # reduce(result) shrinks each fresh result before it is cached and yielded (e.g. to a blob summary); store names
+    # that reduction in the cache parameters.
+    whole_job = names is None
+    if names is None:
+        names = get_slice_images(folder)
+    cache_file = get_analysis_cache_path(cache_folder, folder)
+    cache = load_analysis_cache(cache_file, store)
+    layers = cache["layers"]
+    journal = AnalysisJournal(cache_file, cache["params"])
+
+    signatures = {name: get_layer_signature(folder, name) for name in names}
+    misses = [name for name in names if name not in layers or layers[name][0] != signatures[name]]
+    total = len(names)
+    started = time.monotonic()
+    if len(misses) > 0:
+        print(f"analyze_slices_cached: {total - len(misses)}/{total} layers cached in {folder}")
+
+    analyzed = analyze_slices(folder, names=misses, workers=workers, max_pending=max_pending, memory_budget=memory_budget)
+    changed = os.path.exists(journal.file)
+    finished = False
+    try:
+        for done, name in enumerate(names, start=1):
+            if layers.get(name, [None])[0] == signatures[name]:
+                result = layers[name][1]
+            else:
+                _, result = next(analyzed)
+                if reduce is not None:
+                    result = reduce(result)
+                if result is not False:
+                    layers[name] = [signatures[name], result]
+                    journal.append(name, signatures[name], result)
+                    changed = True
+            yield name, result
+            report_progress(progress, done, total, started)
+        finished = True
+    finally:
+        analyzed.close()
+        journal.close()
+        # Compact once, after a finished pass; an interrupted one keeps its journal and resumes from it
+        if finished:
+            # Drop layers that no longer exist (re-sliced job with fewer layers)
+            if whole_job:
+                for name in [name for name in layers if name not in signatures]:
+                    layers.pop(name)
+                    changed = True
+            if changed:
+                save_analysis_cache(cache_file, cache)
+
+def analyze_slices(folder: str, names=None, workers=None, max_pending=None, progress=None, memory_budget=None):
+    # Yields (name, result) in layer order. At most max_pending images are in flight, which bounds memory
+    # to roughly max_pending decoded slices no matter how many layers the job has.
+    # memory_budget (bytes, per worker) switches large slices to the tiled analysis path.
+    if names is None:
+        names = get_slice_images(folder)
+    total = len(names)
+    workers = get_worker_count(workers)
+    started = time.monotonic()
+
+    if workers == 1 or total < PARALLEL_MIN_LAYERS:
+        for done, name in enumerate(names, start=1):
+            yield name, img_process.analyze_dlp_slice_image(os.path.join(folder, name), memory_budget=memory_budget)
+            report_progress(progress, done, total, started)
+        return
+
+    if max_pending is None:
+        max_pending = workers * 2
+    # spawn: the client runs MQTT/camera threads, which are not safe to fork
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = deque()
+        remaining = iter(names)
+        done = 0
+        for name in remaining:
+            pending.append((name, executor.submit(img_process.analyze_dlp_slice_image, os.path.join(folder, name), memory_budget=memory_budget)))
+            if len(pending) >= max_pending: break
+
+        while pending:
+            name, future = pending.popleft()
+            result = future.result()
+            next_name = next(remaining, None)
+            if next_name is not None:
+                pending.append((next_name, executor.submit(img_process.analyze_dlp_slice_image, os.path.join(folder, next_name), memory_budget=memory_budget)))
+            done += 1
+            yield name, result
+            report_progress(progress, done, total, started)
@@ -0,0 +1,131 @@
+import struct, zlib, lzma
+
+# Binary container for per-layer slice analysis results ({name: {"total", "blob": {"count", "sizes"}}} or False).
+# Layout: header | layer table | layer payloads
+#   header:  magic, version, compression, layer count
+#   table:   per layer -> name, total, count, payload offset (from the first payload), payload length, flags
+#   payload: sorted blob sizes as varint(first) + varint(delta)..., compressed per layer so any layer
+#            can be decoded on its own
+CONTAINER_MAGIC = b"CSLC"
+CONTAINER_VERSION = 1
+CONTAINER_EXTENSION = ".cslc"
+COMPRESSIONS = {None: 0, "zlib": 1, "lzma": 2}
+HEADER = struct.Struct("<4sBBI")
+LAYER = struct.Struct("<QIQIB")
+NAME_LENGTH = struct.Struct("<H")
+# Layer table flag: analysis failed for this layer (stored as False)
+LAYER_FAILED = 0x01
+
+def encode_varints(sizes):
+    # Ascending sizes -> varint(first), varint(delta), ...; deltas of sorted sizes are mostly one byte
+    output = bytearray()
+    previous = 0
+    for size in sizes:
+        value = int(size) - previous
+        if value < 0:
+            raise ValueError("blob sizes must be sorted ascending")
+        previous = int(size)
+        while value >= 0x80:
+            output.append((value & 0x7F) | 0x80)
+            value >>= 7
+        output.append(value)
+    return bytes(output)
+
+def decode_varints(data: bytes, count: int):
+    sizes = list()
+    value = shift = previous = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        sizes.append(previous)
+        value = shift = 0
+    if len(sizes) != count:
+        raise ValueError(f"layer holds {len(sizes)} sizes, expected {count}")
+    return sizes
+
+def compress_payload(data: bytes, compression):
+    if compression == "zlib": return zlib.compress(data, 9)
+    if compression == "lzma": return lzma.compress(data)
+    return data
+
+def decompress_payload(data: bytes, compression):
+    if compression == "zlib": return zlib.decompress(data)
+    if compression == "lzma": return lzma.decompress(data)
+    return data
+
+def encode_slice_container(layers: dict, compression="zlib"):
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"unknown compression: {compression}")
+    table = bytearray()
+    payloads = list()
+    offset = 0
+    for name, layer in layers.items():
+        name_bytes = name.encode("utf-8")
+        if layer is False:
+            payload, total, count, flags = b"", 0, 0, LAYER_FAILED
+        else:
+            payload = compress_payload(encode_varints(layer["blob"]["sizes"]), compression)
+            total, count, flags = layer["total"], layer["blob"]["count"], 0
+        table += NAME_LENGTH.pack(len(name_bytes)) + name_bytes
+        table += LAYER.pack(total, count, offset, len(payload), flags)
+        payloads.append(payload)
+        offset += len(payload)
+    header = HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, COMPRESSIONS[compression], len(layers))
+    return b"".join([header, bytes(table), *payloads])
+
+def write_slice_container(file: str, layers: dict, compression="zlib"):
+    with open(file, 'wb') as f:
+        f.write(encode_slice_container(layers, compression))
+
+class SliceContainer:
+    # Reads the layer table up front; sizes are decoded only for the layers that are asked for
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        magic, version, compression, count = HEADER.unpack_from(self.data, 0)
+        if magic != CONTAINER_MAGIC:
+            raise ValueError("not a slice container")
+        if version != CONTAINER_VERSION:
+            raise ValueError(f"unsupported slice container version: {version}")
+        self.compression = {code: name for name, code in COMPRESSIONS.items()}[compression]
+
+        self.layers = dict()    # name -> (total, count, offset, length, flags)
+        position = HEADER.size
+        for _ in range(count):
+            (length,) = NAME_LENGTH.unpack_from(self.data, position)
+            position += NAME_LENGTH.size
+            name = bytes(self.data[position:position + length]).decode("utf-8")
+            position += length
+            self.layers[name] = LAYER.unpack_from(self.data, position)
+            position += LAYER.size
+        self.payload_start = position
+
+    @classmethod
+    def from_file(cls, file: str):
+        with open(file, 'rb') as f:
+            return cls(f.read())
+
+    def get_names(self):
+        return list(self.layers.keys())
+
+    def get_total(self, name: str):
+        total, _, _, _, flags = self.layers[name]
+        return False if flags & LAYER_FAILED else total
+
+    def get_layer(self, name: str):
+        total, count, offset, length, flags = self.layers[name]
+        if flags & LAYER_FAILED:
+            return False
+        start = self.payload_start + offset
+        sizes = decode_varints(decompress_payload(bytes(self.data[start:start + length]), self.compression), count)
+        return {"total": total, "blob": {"count": count, "sizes": sizes}}
+
+    def iter_layers(self):
+        for name in self.layers:
+            yield name, self.get_layer(name)
+
+def read_slice_container(file: str):
+    # Decodes the whole container back to the dict it was encoded from
+    return dict(SliceContainer.from_file(file).iter_layers())
@@ -0,0 +1,184 @@
+import os, re, mmap
+from array import array
+
+IDX_ENCODINGS = ("utf-8", "latin-1")
+HEADER_END_SECTION = "PixelData"
+# Layers missing from [PixelData] in the compact count array
+MISSING_COUNT = 0xFFFFFFFF
+# One C-level pass over the whole [PixelData] body instead of splitting and matching line by line
+PIXEL_DATA_PATTERN = re.compile(rb"^[ \t]*SEC_(\d+)\.[^=\r\n]*=[ \t]*(\d+)", re.MULTILINE)
+
+def convert_value(key: str, value: str):
+    # Numbers stay numbers, except file names that only look numeric
+    if key != "fileName" and value.replace('.', '', 1).isdigit():
+        return float(value) if '.' in value else int(value)
+    return value
+
+def decode_text(data: bytes):
+    for encoding in IDX_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="backslashreplace")
+
+def parse_gcode_line(line: str):
+    # ;key:value or ;key=value -> (key, value) or None
+    line = line.strip()
+    if not line.startswith(';'): return None
+    separators = [index for index in (line.find(':'), line.find('=')) if index > 1]
+    if not separators: return None
+    key, value = line[1:min(separators)].strip(), line[min(separators) + 1:].strip()
+    if key and key.replace('_', '').isalnum() and value:
+        return key, convert_value(key, value)
+    return None
+
+def parse_gcode_file(file: str, header_only=True):
+    # header_only: stop at the first command line, so multi-MB G-code costs only its comment header
+    gcode = dict()
+    with open(file, 'rb') as f:
+        for raw in f:
+            line = decode_text(raw).strip()
+            if not line: continue
+            if not line.startswith(';'):
+                if header_only: break
+                continue
+            parsed = parse_gcode_line(line)
+            if parsed is not None:
+                gcode[parsed[0]] = parsed[1]
+    return gcode
+
+class IdxFile:
+    # Memory-mapped IDX file. Section offsets are discovered lazily, so header queries never touch [PixelData]
+    # and [PixelData] is parsed only on request, into a compact array of counts.
+    def __init__(self, file: str):
+        self.file = file
+        self.sections = list()    # [name, start of body, end of body]
+        self.scan_position = 0
+        self.scan_done = False
+        self.parsed = dict()
+        self.pixel_counts = None
+
+        with open(file, 'rb') as f:
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file cannot be mapped
+                self.data = b""
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def find_next_section(self):
+        # Advance to the next "[Section]" line (mmap.find, no per-line Python work); False at end of file
+        if self.scan_done: return False
+        data = self.data
+        while True:
+            if self.scan_position == 0 and data[:1] == b"[":
+                start = 0
+            else:
+                newline = data.find(b"\n[", self.scan_position)
+                if newline < 0:
+                    self.scan_done = True
+                    return False
+                start = newline + 1
+            line_end = data.find(b"\n", start)
+            if line_end < 0: line_end = len(data)
+            self.scan_position = line_end
+            close = data.find(b"]", start, line_end)
+            if close < 0: continue
+
+            if self.sections: self.sections[-1][2] = start
+            self.sections.append([decode_text(data[start + 1:close]).strip(), min(line_end + 1, len(data)), len(data)])
+            return True
+
+    def iter_sections(self):
+        # Sections in file order, discovered on demand; the end offset of the last one may still be provisional
+        index = 0
+        while index < len(self.sections) or self.find_next_section():
+            yield self.sections[index]
+            index += 1
+
+    def get_section_offsets(self, name: str):
+        for section in self.iter_sections():
+            if section[0] == name:
+                if section is self.sections[-1]:
+                    # Its end is only known once the following section header is found
+                    self.find_next_section()
+                return section[1], section[2]
+        return None
+
+    def get_section(self, name: str):
+        if name in self.parsed: return self.parsed[name]
+        if name == HEADER_END_SECTION:
+            return {f"SEC_{layer + 1:04d}.png": count for layer, count in enumerate(self.get_pixel_counts()) if count != MISSING_COUNT}
+        offsets = self.get_section_offsets(name)
+        if offsets is None: return None
+
+        section = dict()
+        for line in decode_text(self.data[offsets[0]:offsets[1]]).splitlines():
+            if '=' not in line: continue
+            key, value = line.split('=', 1)
+            key, value = key.strip(), value.strip()
+            if key: section[key] = convert_value(key, value)
+        self.parsed[name] = section
+        return section
+
+    def get_header(self):
+        # Every section before [PixelData]; scanning stops at the PixelData header line
+        header = dict()
+        for section in self.iter_sections():
+            if section[0] == HEADER_END_SECTION: break
+            header[section[0]] = self.get_section(section[0])
+        return header
+
+    def get_pixel_counts(self):
+        # array('I') where index i holds the white pixel count of SEC_{i+1:04d}.png
+        if self.pixel_counts is not None: return self.pixel_counts
+        counts = array('I')
+        offsets = self.get_section_offsets(HEADER_END_SECTION)
+        if offsets is not None:
+            for layer, count in PIXEL_DATA_PATTERN.findall(self.data, offsets[0], offsets[1]):
+                layer = int(layer)
+                if layer < 1: continue
+                if layer == len(counts) + 1:
+                    counts.append(int(count))
+                    continue
+                if layer > len(counts):
+                    counts.extend([MISSING_COUNT] * (layer - len(counts)))
+                counts[layer - 1] = int(count)
+        self.pixel_counts = counts
+        return counts
+
+    def get_sections(self):
+        return [section[0] for section in self.iter_sections()]
+
+def parse_idx_file(file: str):
+    # [Section] / key = value ini-like file -> {section: {key: value}}; PixelData counts are ints
+    with IdxFile(file) as idx:
+        return {name: idx.get_section(name) for name in idx.get_sections()}
+
+def get_idx_header(file: str):
+    with IdxFile(file) as idx:
+        return idx.get_header()
+
+def get_pixel_counts(file: str):
+    with IdxFile(file) as idx:
+        return idx.get_pixel_counts()
+
+def get_pixel_totals(file: str):
+    # {"SEC_0001.png": white pixel count, ...} precomputed by the slicer
+    with IdxFile(file) as idx:
+        return idx.get_section(HEADER_END_SECTION)
+
+def get_total_layer(file: str):
+    if os.path.splitext(file)[1] == ".gcode":
+        return parse_gcode_file(file).get("totalLayer")
+    return get_idx_header(file).get("BuildData", dict()).get("TotalLayer")
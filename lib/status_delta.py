@@ -0,0 +1,84 @@
+import copy, time, threading
+
+def escape_pointer(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+def diff_status(old, new, path=""):
+    # JSON-patch style (RFC 6902 subset) diff: dicts are walked, everything else is replaced as a whole
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        if old == new and type(old) == type(new):
+            return []
+        return [{"op": "replace", "path": path, "value": new}]
+
+    patch = list()
+    for key, value in new.items():
+        child = f"{path}/{escape_pointer(key)}"
+        if key not in old:
+            patch.append({"op": "add", "path": child, "value": value})
+        else:
+            patch.extend(diff_status(old[key], value, child))
+    for key in old:
+        if key not in new:
+            patch.append({"op": "remove", "path": f"{path}/{escape_pointer(key)}"})
+    return patch
+
+def apply_patch(state, patch):
+    state = copy.deepcopy(state)
+    for operation in patch:
+        keys = [key.replace("~1", "/").replace("~0", "~") for key in operation["path"].split("/")[1:]]
+        if not keys:
+            state = copy.deepcopy(operation["value"]); continue
+        target = state
+        for key in keys[:-1]:
+            target = target[key]
+        if operation["op"] == "remove":
+            target.pop(keys[-1], None)
+        else:
+            target[keys[-1]] = copy.deepcopy(operation["value"])
+    return state
+
+class StatusDeltaEncoder:
+    def __init__(self, keyframe_interval=30):
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.last_state = None
+        self.last_keyframe = 0
+        self.keyframe_requested = threading.Event()
+
+        self.keyframe_count = 0
+        self.delta_count = 0
+        self.skip_count = 0
+
+    def request_keyframe(self):
+        # Called from the MQTT thread when a browser (re)joins or detects a sequence gap
+        self.keyframe_requested.set()
+
+    def encode(self, state: dict, force_keyframe=False):
+        # Returns ("keyframe", seq, state), ("delta", seq, patch) or (None, seq, None) when nothing changed
+        now = time.monotonic()
+        if (force_keyframe or self.last_state is None or self.keyframe_requested.is_set()
+                or now - self.last_keyframe >= self.keyframe_interval):
+            self.keyframe_requested.clear()
+            self.seq += 1
+            self.last_state = copy.deepcopy(state)
+            self.last_keyframe = now
+            self.keyframe_count += 1
+            return "keyframe", self.seq, state
+
+        patch = diff_status(self.last_state, state)
+        if not patch:
+            self.skip_count += 1
+            return None, self.seq, None
+
+        self.seq += 1
+        self.last_state = copy.deepcopy(state)
+        self.delta_count += 1
+        return "delta", self.seq, patch
+
+    def get_stats(self):
+        return {
+            "seq": self.seq,
+            "keyframe": self.keyframe_count,
+            "delta": self.delta_count,
+            "skip": self.skip_count
+        }
@@ -1,6 +1,8 @@
 import json
 import sys
 import os
+import copy
+import threading
 from . import status as st
 class StatusManager:
     def __init__(self, device_type, device_number, history_folder):
@@ -17,6 +19,12 @@ class StatusManager:
         
         self.history_folder = history_folder
         
+        # Parsed status files keyed by path, re-read only when (mtime, size, inode) changes
+        self.status_cache = dict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_lock = threading.Lock()
+        
         self.create_json_file()
         
     def get_resource_path(self, relative_path: str):
@@ -29,11 +37,33 @@ class StatusManager:
 
         return os.path.join(base_path, relative_path)
 
+    def get_file_signature(self, path: str):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def get_cached_content(self, file: str):
+        path = self.get_resource_path(file)
+        signature = self.get_file_signature(path)
+        with self.cache_lock:
+            cached = self.status_cache.get(path)
+            if cached is not None and cached[0] == signature:
+                self.cache_hits += 1
+                return cached[1]
+            
+        with open(path, 'r', encoding='utf-8') as content:
+            json_content = json.load(content)
+            
+        # Writer may have replaced the file while we were parsing; only cache what we actually read
+        if self.get_file_signature(path) == signature:
+            with self.cache_lock:
+                self.status_cache[path] = (signature, json_content)
+                self.cache_misses += 1
+        return json_content
+
     def get_json_content(self, file: str):
+        # Returns the cached object itself: treat it as read-only, copy before changing it (see get_print_history)
         try: 
-            with open(self.get_resource_path(file), 'r', encoding='utf-8') as content:
-                json_content = json.load(content) 
-            return json_content 
+            return self.get_cached_content(file)
         except Exception as e:
             print(f"Exception in get_json_content ->{file}: {e}")
             return None
@@ -42,11 +72,37 @@ class StatusManager:
         try:
             with open(self.get_resource_path(file), 'w', encoding='utf-8') as content:
                 json.dump(data, content, ensure_ascii=False, indent=4)
+            self.invalidate_cache(file)
             return True
         except Exception as e:
             print(f"Exception in set_json_content ->{file}: {e}")
             return False
     
+    def invalidate_cache(self, file: str = None):
+        with self.cache_lock:
+            if file is None:
+                self.status_cache.clear()
+            else:
+                self.status_cache.pop(self.get_resource_path(file), None)
+    
+    def get_cache_stats(self):
+        with self.cache_lock:
+            total = self.cache_hits + self.cache_misses
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit-rate": round(self.cache_hits / total, 4) if total > 0 else 0,
+                "files": len(self.status_cache)
+            }
+    
+    def get_status_snapshot(self):
+        # device/sensor/print for a single tick; each file is read once, but they are not locked against each other
+        return {
+            "device": self.get_device_status(),
+            "sensor": self.get_sensor_status(),
+            "print": self.get_print_status()
+        }
+    
     def create_json_file(self):
         self.set_json_content('print-status.json', self.print_status)
         self.set_json_content('device-status.json', self.device_status)
@@ -64,6 +120,7 @@ class StatusManager:
         os.remove(self.get_resource_path("device-request.json"))
         if os.path.exists(self.get_resource_path("print-history.json")):
             os.remove(self.get_resource_path("print-history.json"))
+        self.invalidate_cache()
         
     def get_device_status(self):
         return self.get_json_content(self.get_resource_path('device-status.json'))
@@ -96,7 +153,8 @@ class StatusManager:
         self.set_json_content('print-history.json', self.print_history)
         
     def get_print_history(self):
-        return self.get_json_content(self.get_resource_path('print-history.json'))
+        # Callers fill in and write back the history, so they get their own copy
+        return copy.deepcopy(self.get_json_content(self.get_resource_path('print-history.json')))
     
     def set_print_history(self, data):
         self.set_json_content('print-history.json', data)
@@ -104,6 +162,7 @@ class StatusManager:
     def delete_print_history(self):
         if os.path.exists(self.get_resource_path("print-history.json")):
             os.remove(self.get_resource_path("print-history.json"))
+        self.invalidate_cache("print-history.json")
         
     def add_device_request(self, data):
         with open(self.get_resource_path("device-request.json"), 'r', encoding='utf-8') as file:
@@ -112,4 +171,5 @@ class StatusManager:
         requestlist_dic["request-list"].append(data)
         
         with open(self.get_resource_path("device-request.json"), 'w', encoding='utf-8') as file:
-            json.dump(requestlist_dic, file, indent=4, ensure_ascii=False)  
\ No newline at end of file
+            json.dump(requestlist_dic, file, indent=4, ensure_ascii=False)
+        self.invalidate_cache("device-request.json")  
\ No newline at end of file
@@ -0,0 +1,172 @@
+import os, time, select, struct, threading, ctypes, ctypes.util
+
+WATCH_FILES = ("device-status.json", "print-status.json", "device-alarm.json", "device-config.json")
+
+# inotify(7) flags
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+EVENT_HEADER = struct.Struct("iIII")
+# Polling fallback (no inotify): each round stats every status file, so it stays well below the 1 s status tick
+POLL_INTERVAL = 0.25
+
+def load_inotify():
+    if not os.path.exists("/proc/sys/fs/inotify"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+class StatusWatcher:
+    def __init__(self, status_manager, files=WATCH_FILES, poll_interval=POLL_INTERVAL, use_inotify=True):
+        self.status_manager = status_manager
+        self.files = tuple(files)
+        self.poll_interval = poll_interval
+        self.folder = os.path.dirname(self.status_manager.get_resource_path(self.files[0]))
+
+        self.callbacks = list()
+        self.subscriptions = list()
+        self.contents = dict()
+        self.signatures = dict()
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.libc = load_inotify() if use_inotify else None
+        self.inotify_fd = None
+        self.mode = "INOTIFY" if self.libc is not None else "POLLING"
+
+        for file in self.files:
+            self.contents[file] = self.status_manager.get_json_content(file)
+            self.signatures[file] = self.get_signature(file)
+
+    def get_signature(self, file: str):
+        try:
+            return self.status_manager.get_file_signature(self.status_manager.get_resource_path(file))
+        except OSError:
+            return None
+
+    def add_callback(self, callback):
+        # callback(file, content) is called from the watcher thread on every real content change
+        self.callbacks.append(callback)
+
+    def subscribe(self, files=None):
+        subscription = StatusSubscription(self, files if files is not None else self.files)
+        with self.condition:
+            self.subscriptions.append(subscription)
+        return subscription
+
+    def start(self):
+        if self.thread is not None: return
+        if self.mode == "INOTIFY":
+            try:
+                self.inotify_fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+                if self.inotify_fd < 0:
+                    raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+                mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MODIFY
+                if self.libc.inotify_add_watch(self.inotify_fd, os.fsencode(self.folder), mask) < 0:
+                    raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {self.folder}")
+            except OSError as e:
+                print(f"StatusWatcher inotify fail, fallback to polling: {e}")
+                if self.inotify_fd is not None and self.inotify_fd >= 0:
+                    os.close(self.inotify_fd)
+                self.inotify_fd = None
+                self.mode = "POLLING"
+
+        print(f"StatusWatcher Mode: {self.mode} ({self.folder})")
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                if self.mode == "INOTIFY":
+                    candidates = self.read_inotify_events()
+                else:
+                    time.sleep(self.poll_interval)
+                    candidates = self.files
+                for file in candidates:
+                    self.check_file(file)
+            except Exception as e:
+                print(f"Exception in StatusWatcher: {e}")
+                time.sleep(self.poll_interval)
+
+    def read_inotify_events(self):
+        readable, _, _ = select.select([self.inotify_fd], [], [], 0.5)
+        if not readable: return ()
+
+        # Let a burst of writes (truncate + write + close) settle into one check
+        time.sleep(0.01)
+        try:
+            buffer = os.read(self.inotify_fd, 64 * 1024)
+        except BlockingIOError:
+            return ()
+
+        names = set(); offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            _, _, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            names.add(os.fsdecode(name))
+            offset += EVENT_HEADER.size + length
+        return [file for file in self.files if file in names]
+
+    def check_file(self, file: str):
+        signature = self.get_signature(file)
+        if signature is None or signature == self.signatures.get(file):
+            return
+
+        content = self.status_manager.get_json_content(file)
+        # Half-written file: keep the old signature so the next event re-checks it
+        if content is None: return
+        self.signatures[file] = signature
+        if content == self.contents.get(file): return
+
+        self.contents[file] = content
+        with self.condition:
+            for subscription in self.subscriptions:
+                if file in subscription.files:
+                    subscription.changed.add(file)
+            self.condition.notify_all()
+        for callback in self.callbacks:
+            try:
+                callback(file, content)
+            except Exception as e:
+                print(f"Exception in StatusWatcher callback ->{file}: {e}")
+
+class StatusSubscription:
+    def __init__(self, watcher: StatusWatcher, files):
+        self.watcher = watcher
+        self.files = set(files)
+        self.changed = set()
+
+    def wait(self, timeout=None):
+        # Block until a subscribed file changes or timeout expires; returns the changed files
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.watcher.condition:
+            while not self.changed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return set()
+                self.watcher.condition.wait(remaining)
+            changed = self.changed
+            self.changed = set()
+            return changed
@@ -0,0 +1,218 @@
+import os, json, shutil, subprocess, tempfile, threading
+import cv2
+from . import img_process
+
+# ffmpeg joins segments without decoding them: the system one, else the static build shipped with imageio-ffmpeg
+try:
+    import imageio_ffmpeg
+except ImportError:
+    imageio_ffmpeg = None
+
+# Journal kept next to the frames: closed segments in order and the last frame each one holds.
+# Only journaled segments are trusted after a restart; frames saved after the last of them are replayed.
+JOURNAL_FILE = "timelapse.json"
+SEGMENT_FRAMES = 300
+FRAME_FORMAT = (".jpg", ".png", ".jpeg", ".webp")
+
+# One writer per frame folder, shared by the camera thread (feeding) and the upload thread (finishing)
+WRITERS = dict()
+WRITERS_LOCK = threading.Lock()
+
+def get_writer(folder: str, fps=30, segment_frames=SEGMENT_FRAMES):
+    with WRITERS_LOCK:
+        key = os.path.abspath(folder)
+        if key not in WRITERS:
+            WRITERS[key] = TimelapseWriter(folder, fps=fps, segment_frames=segment_frames)
+        return WRITERS[key]
+
+def has_timelapse(folder: str):
+    # True when frames of this folder were (or are being) encoded incrementally
+    with WRITERS_LOCK:
+        if os.path.abspath(folder) in WRITERS: return True
+    return os.path.exists(os.path.join(folder, JOURNAL_FILE))
+
+def release_writer(folder: str):
+    with WRITERS_LOCK:
+        writer = WRITERS.pop(os.path.abspath(folder), None)
+    if writer is not None:
+        writer.close()
+
+def get_frame_names(folder: str):
+    return sorted(entry.name for entry in os.scandir(folder) if entry.is_file() and entry.name.endswith(FRAME_FORMAT))
+
+def get_ffmpeg():
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None and imageio_ffmpeg is not None:
+        try:
+            ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
+        except RuntimeError:
+            pass
+    return ffmpeg
+
+def merge_segments(segments: list, output_file: str, fps):
+    if len(segments) == 1:
+        os.replace(segments[0], output_file)
+        return
+    ffmpeg = get_ffmpeg()
+    if ffmpeg is not None:
+        # Stream copy: no decoding, seconds even for a long print
+        with tempfile.NamedTemporaryFile('w', suffix=".txt", delete=False) as f:
+            f.writelines(f"file '{os.path.abspath(segment)}'\n" for segment in segments)
+            list_file = f.name
+        try:
+            result = subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", output_file], capture_output=True)
+            if result.returncode == 0:
+                for segment in segments: os.remove(segment)
+                return
+            print(f"merge_segments ffmpeg error: {result.stderr.decode(errors='replace').strip()}")
+        finally:
+            os.remove(list_file)
+
+    # No ffmpeg: re-encode the segments back to back (as slow as the batch encode; callers run this off the camera thread)
+    print(f"merge_segments: no ffmpeg, re-encoding {len(segments)} segments into {output_file}")
+    video = None
+    for segment in segments:
+        capture = cv2.VideoCapture(segment)
+        while True:
+            ret, frame = capture.read()
+            if not ret: break
+            if video is None:
+                video = cv2.VideoWriter(output_file, cv2.VideoWriter_fourcc(*'mp4v'), fps, (frame.shape[1], frame.shape[0]))
+            video.write(frame)
+        capture.release()
+    if video is not None:
+        video.release()
+    for segment in segments: os.remove(segment)
+
+class TimelapseWriter:
+    # Encodes frames into short MP4 segments while the print runs; finish() only merges them.
+    def __init__(self, folder: str, fps=30, segment_frames=SEGMENT_FRAMES):
+        self.folder = folder
+        self.fps = fps
+        self.segment_frames = segment_frames
+        self.lock = threading.Lock()
+        self.video = None
+        self.segment_file = None
+        self.segment_count = 0
+        self.segment_last = None
+        self.journal = self.load_journal()
+        self.last_name = self.get_last_frame()
+        if self.journal["finished"] == False:
+            self.recover()
+
+    def get_journal_path(self):
+        return os.path.join(self.folder, JOURNAL_FILE)
+
+    def load_journal(self):
+        try:
+            with open(self.get_journal_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"TimelapseWriter load_journal error ->{self.folder}: {e}")
+        return {"fps": self.fps, "size": None, "segments": list(), "finished": False, "output": None}
+
+    def save_journal(self):
+        os.makedirs(self.folder, exist_ok=True)
+        temp_file = f"{self.get_journal_path()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.journal, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.get_journal_path())
+
+    def get_last_frame(self):
+        # After finish() the segments are merged away; the journal then remembers the last frame itself
+        return self.journal["segments"][-1]["last"] if self.journal["segments"] else self.journal.get("last")
+
+    def recover(self):
+        # Drop the segment that was open when the client stopped, then re-encode the frames it held
+        if not os.path.exists(self.folder): return
+        journaled = {segment["file"] for segment in self.journal["segments"]}
+        for name in os.listdir(self.folder):
+            if name.startswith("timelapse-") and name.endswith(".mp4") and name not in journaled:
+                os.remove(os.path.join(self.folder, name))
+
+        last = self.get_last_frame()
+        replay = [name for name in get_frame_names(self.folder) if last is None or name > last]
+        if replay:
+            print(f"TimelapseWriter: replaying {len(replay)} frames in {self.folder}")
+        size = tuple(self.journal["size"]) if self.journal["size"] else None
+        for name, frame in zip(replay, img_process.iter_decoded_frames([os.path.join(self.folder, name) for name in replay], size=size)):
+            if frame is not None:
+                self.write_frame(frame, name)
+
+    def open_segment(self, frame):
+        if self.journal["size"] is None:
+            self.journal["size"] = [frame.shape[1], frame.shape[0]]
+        self.segment_file = f"timelapse-{len(self.journal['segments']) + 1:04d}.mp4"
+        self.video = cv2.VideoWriter(os.path.join(self.folder, self.segment_file), cv2.VideoWriter_fourcc(*'mp4v'), self.journal["fps"], tuple(self.journal["size"]))
+        self.segment_count = 0
+
+    def close_segment(self):
+        if self.video is None: return
+        self.video.release()
+        self.video = None
+        if self.segment_count > 0:
+            self.journal["segments"].append({"file": self.segment_file, "frames": self.segment_count, "last": self.segment_last})
+            self.save_journal()
+        else:
+            os.remove(os.path.join(self.folder, self.segment_file))
+
+    def write_frame(self, frame, name: str):
+        if self.video is None:
+            self.open_segment(frame)
+        size = tuple(self.journal["size"])
+        if (frame.shape[1], frame.shape[0]) != size:
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        self.video.write(frame)
+        self.segment_count += 1
+        self.segment_last = name
+        self.last_name = name
+        if self.segment_count >= self.segment_frames:
+            self.close_segment()
+
+    def add_frame(self, frame, name: str):
+        # name: the saved frame file, so a restart knows which frames are already encoded
+        with self.lock:
+            if self.journal["finished"] == True:
+                self.reopen()
+            # Already encoded by recover() (the frame was on disk when the writer was created)
+            if self.last_name is not None and name <= self.last_name: return
+            self.write_frame(frame, name)
+
+    def reopen(self):
+        # Frames arrived after finish(): the merged video becomes the first segment again and encoding carries on
+        segments = list()
+        output = self.journal["output"]
+        if output and os.path.exists(output):
+            segment_file = "timelapse-0001.mp4"
+            os.replace(output, os.path.join(self.folder, segment_file))
+            segments.append({"file": segment_file, "frames": self.journal.get("frames", 0), "last": self.journal.get("last")})
+        self.journal["segments"] = segments
+        self.journal["finished"] = False
+        self.journal["output"] = None
+        self.save_journal()
+
+    def finish(self, output_file: str):
+        # Idempotent: the camera thread finishes on PRINTING_FINISH / PRINTING_ABORT, the upload thread may ask again
+        with self.lock:
+            if self.journal["finished"] == True and self.journal["output"] and os.path.exists(self.journal["output"]):
+                return self.journal["output"]
+            self.close_segment()
+            segments = [os.path.join(self.folder, segment["file"]) for segment in self.journal["segments"]]
+            if not segments:
+                return None
+            merge_segments(segments, output_file, self.journal["fps"])
+            self.journal["frames"] = sum(segment["frames"] for segment in self.journal["segments"])
+            self.journal["last"] = self.get_last_frame()
+            self.journal["segments"] = list()
+            self.journal["finished"] = True
+            self.journal["output"] = output_file
+            self.save_journal()
+            return output_file
+
+    def close(self):
+        with self.lock:
+            self.close_segment()
@@ -0,0 +1,54 @@
+import os, sys, time, shutil, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import cam_manager
+
+FRAMES = 300
+WIDTH = 1280
+HEIGHT = 720
+SOURCE_FPS = None  # None: the synthetic source produces frames as fast as it can
+
+def run_capture(client_cam, frames):
+    # capture_image is what cam_handler publishes outside of PRINTING
+    latencies = list()
+    for _ in range(frames):
+        start = time.perf_counter()
+        client_cam.capture_image()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def run_save(client_cam, frames):
+    # save_image is the PRINTING path: archive rendition to disk, timelapse segment, live rendition returned
+    latencies = list()
+    for _ in range(frames):
+        start = time.perf_counter()
+        client_cam.save_image(sub_folder="bench")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    print(f"{label:8} {len(latencies) / total:7.1f} frame/s / p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms / p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.1f} ms")
+
+def main():
+    folder = tempfile.mkdtemp(prefix="bench-cam-")
+    client_cam = cam_manager.CamManager(width=WIDTH, height=HEIGHT, cam_folder=folder, backend="synthetic", backend_options={"fps": SOURCE_FPS})
+    try:
+        report("CAPTURE:", run_capture(client_cam, FRAMES))
+        report("SAVE:", run_save(client_cam, FRAMES))
+        client_cam.finish_timelapse(sub_folder="bench")
+        print(f"RENDITIONS: {client_cam.get_rendition_stats()}")
+
+        # Replay the frames just saved, through the background capture thread
+        replay_cam = cam_manager.CamManager(width=WIDTH, height=HEIGHT, cam_folder=folder, timelapse_fps=None, capture_fps=30, backend="replay", backend_options={"folder": os.path.join(folder, "bench"), "fps": 30})
+        time.sleep(3)
+        report("REPLAY:", run_capture(replay_cam, FRAMES))
+        print(f"CAPTURE STATS: {replay_cam.get_capture_stats()}")
+        replay_cam.release()
+    finally:
+        client_cam.release()
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    main()
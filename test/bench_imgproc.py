@@ -0,0 +1,70 @@
+import os, sys, time, tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import img_process
+
+WIDTH = 4240
+HEIGHT = 3840
+ISLANDS = 30000
+REPEAT = 3
+
+def analyze_dlp_slice_image_legacy(image_path):
+    # Reference: the implementation before the vectorized rework
+    with open(image_path, 'rb') as f:
+        bytes_data = f.read()
+    np_array = np.frombuffer(bytes_data, np.uint8)
+    img = cv2.imdecode(np_array, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return False
+
+    _, binary_img = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
+    total_white_pixels = int(np.sum(binary_img == 255))
+    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(binary_img, connectivity=8, ltype=cv2.CV_32S)
+
+    blob_sizes = list()
+    for i in range(1, num_labels):
+        area = stats[i, cv2.CC_STAT_AREA]
+        blob_sizes.append(int(area))
+    blob_sizes.sort()
+
+    return {"total": total_white_pixels, "blob": {"count": len(blob_sizes), "sizes": blob_sizes}}
+
+def create_lattice_slice(file):
+    # Many small islands, like a layer cutting through lattice supports
+    rng = np.random.default_rng(0)
+    img = np.zeros((HEIGHT, WIDTH), np.uint8)
+    xs = rng.integers(0, WIDTH, ISLANDS)
+    ys = rng.integers(0, HEIGHT, ISLANDS)
+    radii = rng.integers(1, 6, ISLANDS)
+    for x, y, r in zip(xs, ys, radii):
+        cv2.circle(img, (int(x), int(y)), int(r), 255, -1)
+    cv2.circle(img, (WIDTH // 2, HEIGHT // 2), 600, 255, -1)
+    cv2.imwrite(file, img)
+
+def measure(function):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        result = function()
+    return (time.perf_counter() - start) / REPEAT * 1000, result
+
+def main():
+    file = os.path.join(tempfile.mkdtemp(prefix="bench-imgproc-"), "SEC_0001.png")
+    try:
+        create_lattice_slice(file)
+        legacy_time, legacy = measure(lambda: analyze_dlp_slice_image_legacy(file))
+        list_time, current = measure(lambda: img_process.analyze_dlp_slice_image(file))
+        array_time, as_array = measure(lambda: img_process.analyze_dlp_slice_image(file, as_array=True))
+
+        print(f"IMAGE: {WIDTH}x{HEIGHT} / BLOBS: {legacy['blob']['count']}")
+        print(f"LEGACY:        {legacy_time:8.1f} ms")
+        print(f"CURRENT(list): {list_time:8.1f} ms ({legacy_time / list_time:.2f}x)")
+        print(f"CURRENT(array):{array_time:8.1f} ms ({legacy_time / array_time:.2f}x)")
+        print(f"IDENTICAL: {legacy == current and legacy == img_process.to_json_result(as_array)}")
+    finally:
+        os.remove(file)
+        os.rmdir(os.path.dirname(file))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os, sys, time, shutil, tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import img_process, slice_analysis
+
+LAYERS = 96
+WIDTH = 1920
+HEIGHT = 1080
+WORKERS = None  # None: one per core
+
+def create_synthetic_slices(folder, layers, width, height):
+    rng = np.random.default_rng(0)
+    for i in range(1, layers + 1):
+        img = np.zeros((height, width), np.uint8)
+        for _ in range(200):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            cv2.circle(img, center, int(rng.integers(2, 40)), 255, -1)
+        cv2.imwrite(os.path.join(folder, f"SEC_{i:04d}.png"), img)
+
+def run_serial(folder):
+    return [(name, img_process.analyze_dlp_slice_image(os.path.join(folder, name))) for name in slice_analysis.get_slice_images(folder)]
+
+def run_parallel(folder):
+    return list(slice_analysis.analyze_slices(folder, workers=WORKERS))
+
+def main():
+    folder = tempfile.mkdtemp(prefix="bench-slices-")
+    try:
+        create_synthetic_slices(folder, LAYERS, WIDTH, HEIGHT)
+
+        start = time.perf_counter()
+        serial = run_serial(folder)
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel = run_parallel(folder)
+        parallel_time = time.perf_counter() - start
+
+        print(f"LAYERS: {LAYERS} ({WIDTH}x{HEIGHT}) / WORKERS: {slice_analysis.get_worker_count(WORKERS)}")
+        print(f"SERIAL:   {serial_time:.2f}s ({LAYERS / serial_time:.1f} layer/s)")
+        print(f"PARALLEL: {parallel_time:.2f}s ({LAYERS / parallel_time:.1f} layer/s)")
+        print(f"SPEEDUP:  {serial_time / parallel_time:.2f}x")
+        print(f"IDENTICAL: {serial == parallel}")
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os, sys, time, shutil, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import slice_parser
+import test_idxgcode_to_json as prototype
+
+SAMPLE_IDX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample", "test.idx")
+SAMPLE_GCODE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample", "test.gcode")
+LAYERS = 20000
+GCODE_MOVES = 200000
+REPEAT = 5
+
+def create_large_idx(file, layers):
+    with open(SAMPLE_IDX, 'r', encoding='utf-8') as f:
+        header = f.read().split("[PixelData]")[0]
+    with open(file, 'w', encoding='utf-8') as f:
+        f.write(header)
+        f.write("[PixelData]\n")
+        for i in range(1, layers + 1):
+            f.write(f"SEC_{i:04d}.png = {(i * 7919) % 400000}\n")
+        f.write("\n[TotalPixelWhiteCount]\nTotalPixelWhiteCount = 0\n")
+
+def create_large_gcode(file, moves):
+    with open(SAMPLE_GCODE, 'r', encoding='utf-8') as f:
+        header = f.read()
+    with open(file, 'w', encoding='utf-8') as f:
+        f.write(header.rstrip() + "\n")
+        for i in range(moves):
+            f.write(f"G1 Z{i * 0.1:.2f} F300\nM106 S255\n")
+
+def measure(function):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        result = function()
+    return (time.perf_counter() - start) / REPEAT * 1000, result
+
+def run_prototype_idx(file):
+    with open(file, 'r', encoding='utf-8') as f:
+        return prototype.parse_idx_file(f.read())["idx_file"]
+
+def run_prototype_gcode(file):
+    with open(file, 'r', encoding='utf-8') as f:
+        return prototype.parse_gcode_file(f.read())["gcode_file"]
+
+def main():
+    folder = tempfile.mkdtemp(prefix="bench-parser-")
+    try:
+        idx_file = os.path.join(folder, "large.idx")
+        gcode_file = os.path.join(folder, "large.gcode")
+        create_large_idx(idx_file, LAYERS)
+        create_large_gcode(gcode_file, GCODE_MOVES)
+        print(f"IDX: {LAYERS} layers ({os.path.getsize(idx_file) / 1e6:.1f} MB) / GCODE: {os.path.getsize(gcode_file) / 1e6:.1f} MB")
+
+        regex_time, regex_idx = measure(lambda: run_prototype_idx(idx_file))
+        header_time, header = measure(lambda: slice_parser.get_idx_header(idx_file))
+        counts_time, counts = measure(lambda: slice_parser.get_pixel_counts(idx_file))
+        print(f"IDX REGEX (full):       {regex_time:8.2f} ms")
+        print(f"IDX HEADER ONLY:        {header_time:8.2f} ms ({regex_time / header_time:.0f}x)")
+        print(f"IDX PIXELDATA (array):  {counts_time:8.2f} ms ({regex_time / counts_time:.1f}x)")
+        print(f"IDENTICAL HEADER: {all(header[name] == regex_idx[name] for name in header)}")
+        print(f"IDENTICAL PIXELDATA: {list(counts) == list(regex_idx['PixelData'].values())}")
+
+        regex_time, regex_gcode = measure(lambda: run_prototype_gcode(gcode_file))
+        header_time, gcode = measure(lambda: slice_parser.parse_gcode_file(gcode_file))
+        print(f"GCODE REGEX (full):     {regex_time:8.2f} ms")
+        print(f"GCODE HEADER ONLY:      {header_time:8.2f} ms ({regex_time / header_time:.0f}x)")
+        print(f"IDENTICAL GCODE: {gcode == regex_gcode}")
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    main()
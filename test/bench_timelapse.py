@@ -0,0 +1,64 @@
+import os, sys, time, shutil, tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import img_process
+
+FRAMES = 10000
+WIDTH = 1280
+HEIGHT = 720
+FPS = 30
+WORKERS = None  # None: one per core
+
+def create_legacy_timelapse(src_folder, output_file, fps):
+    # Reference: decode and encode in one thread, one frame at a time
+    images = sorted(img for img in os.listdir(src_folder) if img.endswith((".jpg", ".png", ".jpeg", ".webp")))
+    height, width, _ = cv2.imread(os.path.join(src_folder, images[0])).shape
+    video = cv2.VideoWriter(output_file, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for image_name in images:
+        video.write(cv2.imread(os.path.join(src_folder, image_name)))
+    video.release()
+
+def create_synthetic_frames(folder, frames, width, height):
+    # A moving build plate over a noisy background, saved like CamManager.save_image
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+    for i in range(frames):
+        frame = background.copy()
+        cv2.rectangle(frame, (width // 4, (i * 7) % height), (width * 3 // 4, (i * 7) % height + 40), (200, 200, 200), -1)
+        cv2.imwrite(os.path.join(folder, f"cam-{1700000000 + i}.webp"), frame, [cv2.IMWRITE_WEBP_QUALITY, 50])
+
+def get_frame_count(file):
+    capture = cv2.VideoCapture(file)
+    count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return count
+
+def measure(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+def main():
+    folder = tempfile.mkdtemp(prefix="bench-timelapse-")
+    try:
+        create_synthetic_frames(folder, FRAMES, WIDTH, HEIGHT)
+        legacy_file = os.path.join(folder, "legacy.mp4")
+        pipelined_file = os.path.join(folder, "pipelined.mp4")
+        decimated_file = os.path.join(folder, "decimated.mp4")
+
+        legacy_time = measure(lambda: create_legacy_timelapse(folder, legacy_file, FPS))
+        pipelined_time = measure(lambda: img_process.create_timelapse(folder, pipelined_file, FPS, workers=WORKERS))
+        decimated_time = measure(lambda: img_process.create_timelapse(folder, decimated_file, FPS, size=(WIDTH // 2, HEIGHT // 2), step=2, workers=WORKERS))
+
+        print(f"FRAMES: {FRAMES} ({WIDTH}x{HEIGHT}) / WORKERS: {WORKERS or os.cpu_count()}")
+        print(f"LEGACY:              {legacy_time:7.2f}s ({FRAMES / legacy_time:.1f} frame/s)")
+        print(f"PIPELINED:           {pipelined_time:7.2f}s ({legacy_time / pipelined_time:.2f}x)")
+        print(f"HALF SIZE, STEP 2:   {decimated_time:7.2f}s ({legacy_time / decimated_time:.2f}x)")
+        print(f"FRAME COUNT: {get_frame_count(legacy_file)} / {get_frame_count(pipelined_file)} / {get_frame_count(decimated_file)}")
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    main()
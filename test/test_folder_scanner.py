@@ -0,0 +1,33 @@
+import os, sys, shutil, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import folder_scanner
+
+def get_types(events):
+    return sorted((event["type"], event["name"]) for event in events)
+
+def test_events():
+    folder = tempfile.mkdtemp(prefix="folder-scanner-")
+    try:
+        os.makedirs(os.path.join(folder, "job.zip_sl"))
+        with open(os.path.join(folder, "job.zip_sl", "SEC_0001.png"), 'wb') as f: f.write(b"1")
+        scanner = folder_scanner.FolderScanner(folder, include=lambda entry: entry.is_dir())
+        assert get_types(scanner.scan()) == [("added", "job.zip_sl")]
+        assert scanner.scan() == []
+
+        # A file added to the folder changes the folder's own mtime
+        job = os.path.join(folder, "job.zip_sl")
+        stat = os.stat(job)
+        with open(os.path.join(job, "job.idx"), 'wb') as f: f.write(b"2")
+        os.utime(job, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert get_types(scanner.scan()) == [("modified", "job.zip_sl")]
+        assert scanner.scan() == []
+
+        shutil.rmtree(os.path.join(folder, "job.zip_sl"))
+        assert get_types(scanner.scan()) == [("removed", "job.zip_sl")]
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    test_events()
+    print("OK")
@@ -0,0 +1,59 @@
+import os, sys, shutil, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import frame_store
+
+def create_frames(folder: str, print_name: str, times: list, size=1000):
+    os.makedirs(os.path.join(folder, print_name), exist_ok=True)
+    for timestamp in times:
+        with open(os.path.join(folder, print_name, f"cam-{timestamp}.webp"), 'wb') as f:
+            f.write(b"\0" * size)
+
+def test_budget():
+    folder = tempfile.mkdtemp(prefix="frame-store-")
+    try:
+        now = int(time.time())
+        create_frames(folder, "old", range(now - 7200, now - 3600, 10))
+        create_frames(folder, "new", range(now - 600, now, 2))
+        store = frame_store.FrameStore(folder, max_bytes=400 * 1000)
+        store.enforce_budget()
+        usage = store.get_usage()
+        assert usage["bytes"] <= 400 * 1000 and usage["evicted_frames"] > 0, usage
+        for print_name in ("old", "new"):
+            names = sorted(os.listdir(os.path.join(folder, print_name)))
+            assert names == store.prints[print_name]["names"]
+            # First and newest protected frames stay
+            assert len(names) > frame_store.PROTECT_FRAMES
+    finally:
+        shutil.rmtree(folder)
+
+def test_no_protected_frames():
+    folder = tempfile.mkdtemp(prefix="frame-store-")
+    try:
+        now = int(time.time())
+        create_frames(folder, "print", range(now - 100, now))
+        store = frame_store.FrameStore(folder, max_bytes=10 * 1000, protect_frames=0)
+        store.enforce_budget()
+        names = store.prints["print"]["names"]
+        assert names[0] == f"cam-{now - 100}.webp" and names[-1] == f"cam-{now - 1}.webp", names
+        assert store.get_usage()["bytes"] <= 10 * 1000
+    finally:
+        shutil.rmtree(folder)
+
+def test_same_second_names():
+    folder = tempfile.mkdtemp(prefix="frame-store-")
+    try:
+        create_frames(folder, "print", [100])
+        os.rename(os.path.join(folder, "print", "cam-100.webp"), os.path.join(folder, "print", "cam-100_01.webp"))
+        create_frames(folder, "print", [100, 101])
+        store = frame_store.FrameStore(folder)
+        assert store.prints["print"]["times"] == [100, 100, 101]
+        assert store.prints["print"]["names"] == ["cam-100.webp", "cam-100_01.webp", "cam-101.webp"]
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    test_budget()
+    test_no_protected_frames()
+    test_same_second_names()
+    print("OK")
@@ -0,0 +1,99 @@
+import os, sys, json, shutil, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import log_manager
+
+DEVICE = {"type": "DM400", "number": 1}
+
+def create_records(count=300):
+    records = list()
+    for i in range(count):
+        record = {
+            "timestamp": 1000 + i,
+            "device": {"status": "PRINTING" if i < 200 else "PRINTING_FINISH", "door": i % 7 == 0, "count": i % 2},
+            "sensor": {"temperature": {"current": round(24 + i * 0.01, 2), "target": 25.0}},
+            "print": {}
+        }
+        # Appears mid-segment, then disappears again
+        if 100 <= i < 150:
+            record["print"] = {"current-layer": i - 100, "extra": {"note": None, "list": [i, "x"]}}
+        records.append(record)
+    # Same value, different types: must not be merged into one run
+    records[10]["device"]["count"] = True
+    records[11]["device"]["count"] = 1
+    records[12]["device"]["count"] = 1.0
+    records[13]["device"]["count"] = False
+    records[14]["device"]["count"] = 0
+    return records
+
+def assert_same(decoded: list, records: list):
+    # json round trip keeps bool/int/float apart only through their JSON spelling, so compare that
+    assert json.dumps(decoded, sort_keys=True) == json.dumps(records, sort_keys=True)
+
+def test_segment_round_trip():
+    records = create_records()
+    segment = json.loads(json.dumps(log_manager.encode_log_segment(records, DEVICE)))
+    assert segment["format"] == log_manager.SEGMENT_FORMAT and segment["count"] == len(records)
+    assert_same(log_manager.decode_log_segment(segment), records)
+    assert log_manager.decode_log_segment(log_manager.encode_log_segment([], DEVICE)) == []
+    assert_same(log_manager.decode_log_segment(log_manager.encode_log_segment([{}, {"a": {}}, {}], DEVICE)), [{}, {"a": {}}, {}])
+
+def test_segment_file_and_fields():
+    records = create_records()
+    folder = tempfile.mkdtemp(prefix="log-manager-")
+    try:
+        for extension in log_manager.SEGMENT_EXTENSIONS.values():
+            file = log_manager.write_log_segment(os.path.join(folder, f"DM400-1-1000{extension}"), records, DEVICE)
+            device, decoded = log_manager.read_log_segment(file)
+            assert device == DEVICE
+            assert_same(decoded, records)
+
+            _, projected = log_manager.read_log_segment(file, fields=["sensor/temperature/current", "print/current-layer"])
+            expected = list()
+            for record in records:
+                selected = {"timestamp": record["timestamp"], "sensor": {"temperature": {"current": record["sensor"]["temperature"]["current"]}}}
+                if "current-layer" in record["print"]:
+                    selected["print"] = {"current-layer": record["print"]["current-layer"]}
+                expected.append(selected)
+            assert_same(projected, expected)
+            assert log_manager.convert_segment_to_log(file) == {"device": DEVICE, "data": decoded}
+    finally:
+        shutil.rmtree(folder)
+
+def create_log_manager(folder: str, **options):
+    with open(os.path.join(folder, "device-log.json"), 'w', encoding='utf-8') as f:
+        json.dump({"updated-list": []}, f)
+    return log_manager.LogManager("DM400", 1, folder, **options)
+
+def test_query():
+    records = create_records()
+    folder = tempfile.mkdtemp(prefix="log-manager-")
+    try:
+        manager = create_log_manager(folder, max_entries=120, sync_entries=1000)
+        for record in records:
+            manager.append_log(record)
+        for thread in manager.compactions: thread.join()
+        # Two rotated segments and the open JSONL with the last 60 records (not yet fsynced)
+        index = manager.get_index_entries()
+        assert sorted(entry["format"] for entry in index.values()) == ["jsonl", "segment", "segment"]
+
+        # Across the second segment and the open file, starting inside the segment
+        assert_same(manager.query(1200, 1270), records[200:271])
+        assert_same(manager.query(1100, 1130, fields=["print/current-layer"]), [{"timestamp": record["timestamp"], "print": {"current-layer": record["print"]["current-layer"]}} for record in records[100:131]])
+        assert manager.query(2000, 3000) == []
+        assert len(manager.query(0, 10**10)) == len(records)
+
+        # Unindexed files (index lost in a crash) are indexed again by scanning them
+        manager.close_log()
+        os.remove(os.path.join(folder, log_manager.INDEX_FILE))
+        manager = log_manager.LogManager("DM400", 1, folder)
+        assert_same(manager.query(1000, 1299), records)
+        assert_same(manager.query(1119, 1121), records[119:122])
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    test_segment_round_trip()
+    test_segment_file_and_fields()
+    test_query()
+    print("OK")
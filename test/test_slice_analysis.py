@@ -0,0 +1,50 @@
+import os, sys, json, shutil, tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import slice_analysis
+
+def create_slices(folder: str, layers=120):
+    os.makedirs(folder)
+    for i in range(1, layers + 1):
+        img = np.zeros((60, 60), dtype=np.uint8)
+        cv2.circle(img, (30, 30), i % 25 + 1, 255, -1)
+        img[0:2, 0:i % 5] = 255
+        cv2.imwrite(os.path.join(folder, f"SEC_{i:04d}.png"), img)
+
+def test_resume_and_compact():
+    root = tempfile.mkdtemp(prefix="slice-analysis-")
+    try:
+        folder, cache_folder = os.path.join(root, "job.zip_sl"), os.path.join(root, "cache")
+        create_slices(folder)
+        expected = dict(slice_analysis.analyze_slices(folder, workers=1))
+        journal = os.path.join(cache_folder, "job.zip_sl.jsonl")
+
+        # Interrupted: every analysed layer is in the journal, nothing is compacted yet
+        analyzed = slice_analysis.analyze_slices_cached(folder, cache_folder, workers=1)
+        for _ in range(70): next(analyzed)
+        analyzed.close()
+        assert os.listdir(cache_folder) == ["job.zip_sl.jsonl"]
+        with open(journal, 'r', encoding='utf-8') as f:
+            assert len(f.readlines()) == 1 + 70
+
+        # Resumed: the rest is analysed, then journal and cache are compacted into one file
+        assert dict(slice_analysis.analyze_slices_cached(folder, cache_folder, workers=1)) == expected
+        assert os.listdir(cache_folder) == ["job.zip_sl.json"]
+
+        # A torn journal line is skipped; a cache made for another blob mode is not reused
+        with open(journal, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"params": slice_analysis.get_analysis_params()}) + '\n["SEC_0001.png",[1,')
+        assert dict(slice_analysis.analyze_slices_cached(folder, cache_folder, workers=1)) == expected
+        totals = dict(slice_analysis.analyze_slices_cached(folder, cache_folder, workers=1, reduce=lambda layer: {"total": layer["total"]}, store={"blob": "total"}))
+        assert totals == {name: {"total": layer["total"]} for name, layer in expected.items()}
+
+        slice_analysis.remove_analysis_cache(cache_folder, folder)
+        assert os.listdir(cache_folder) == []
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == "__main__":
+    test_resume_and_compact()
+    print("OK")
@@ -0,0 +1,46 @@
+import os, sys, json, random, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import slice_container
+
+def create_layers(layers=200):
+    random.seed(0)
+    result = dict()
+    for i in range(1, layers + 1):
+        sizes = sorted(random.choice((1, 2, 3, 5, 8, random.randint(1, 400000))) for _ in range(random.randint(0, 3000)))
+        result[f"SEC_{i:04d}.png"] = {"total": sum(sizes) + random.randint(0, 100), "blob": {"count": len(sizes), "sizes": sizes}}
+    result["SEC_0050.png"] = False
+    return result
+
+def test_round_trip():
+    layers = create_layers()
+    for compression in slice_container.COMPRESSIONS:
+        data = slice_container.encode_slice_container(layers, compression=compression)
+        container = slice_container.SliceContainer(data)
+        assert dict(container.iter_layers()) == layers, compression
+        assert container.get_names() == list(layers.keys())
+        print(f"{str(compression):5}: {len(data):>9} bytes")
+    print(f"JSON : {len(json.dumps(layers, indent=4)):>9} bytes")
+
+def test_random_access():
+    layers = create_layers()
+    container = slice_container.SliceContainer(slice_container.encode_slice_container(layers))
+    assert container.get_layer("SEC_0123.png") == layers["SEC_0123.png"]
+    assert container.get_total("SEC_0123.png") == layers["SEC_0123.png"]["total"]
+    assert container.get_layer("SEC_0050.png") is False
+
+def test_file():
+    layers = {"SEC_0001.png": {"total": 0, "blob": {"count": 0, "sizes": []}}, "SEC_0002.png": {"total": 2**40, "blob": {"count": 2, "sizes": [1, 2**35]}}}
+    file = os.path.join(tempfile.mkdtemp(prefix="slice-container-"), "history.cslc")
+    try:
+        slice_container.write_slice_container(file, layers, compression="lzma")
+        assert slice_container.read_slice_container(file) == layers
+    finally:
+        os.remove(file)
+        os.rmdir(os.path.dirname(file))
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_random_access()
+    test_file()
+    print("OK")
@@ -0,0 +1,62 @@
+import os, sys, copy, json, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import status_delta
+
+def create_status():
+    return {
+        "device": {"status": "PRINTING_RUN", "door": False, "name/with~chars": 1},
+        "sensor": {"temperature": 24.5, "humidity": 40, "resin": {"level": 0.8, "temperature": 25.1}},
+        "print": {"current-layer": 10, "total-layer": 300, "slices": [1, 2, 3]}
+    }
+
+def change_status(status: dict, rng: random.Random):
+    status = copy.deepcopy(status)
+    status["print"]["current-layer"] += 1
+    status["sensor"]["temperature"] = round(status["sensor"]["temperature"] + rng.uniform(-0.5, 0.5), 1)
+    if rng.random() < 0.2:
+        status["device"]["status"] = rng.choice(["PRINTING_RUN", "PRINTING_PAUSE"])
+    if rng.random() < 0.2:
+        status["sensor"].pop("resin", None) if "resin" in status["sensor"] else status["sensor"].update(resin={"level": rng.random()})
+    if rng.random() < 0.1:
+        status["print"]["slices"].append(len(status["print"]["slices"]))
+    return status
+
+def test_round_trip():
+    rng = random.Random(0)
+    old = create_status()
+    for _ in range(500):
+        new = change_status(old, rng)
+        patch = status_delta.diff_status(old, new)
+        snapshot = copy.deepcopy(old)
+        assert status_delta.apply_patch(old, patch) == new
+        # The patch survives the MQTT round trip and never changes the state it is applied to
+        assert status_delta.apply_patch(old, json.loads(json.dumps(patch))) == new
+        assert old == snapshot
+        old = new
+    assert status_delta.apply_patch(old, status_delta.diff_status(old, {"other": True})) == {"other": True}
+    assert status_delta.apply_patch(1, status_delta.diff_status(1, {"a": 1})) == {"a": 1}
+
+def test_encoder():
+    rng = random.Random(1)
+    encoder = status_delta.StatusDeltaEncoder(keyframe_interval=3600)
+    state = None
+    status = create_status()
+    for i in range(100):
+        if i % 10 != 9:
+            status = change_status(status, rng)
+        kind, seq, payload = encoder.encode(status)
+        if kind == "keyframe":
+            state = copy.deepcopy(payload)
+        elif kind == "delta":
+            state = status_delta.apply_patch(state, payload)
+        assert state == status, i
+    encoder.request_keyframe()
+    assert encoder.encode(status)[0] == "keyframe"
+    stats = encoder.get_stats()
+    assert stats == {"seq": 91, "keyframe": 2, "delta": 89, "skip": 10}, stats
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_encoder()
+    print("OK")
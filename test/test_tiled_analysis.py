@@ -0,0 +1,50 @@
+import os, sys, shutil, tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import img_process
+
+def create_image(rng: np.random.Generator):
+    # Noise plus shapes that cross many strip boundaries: diagonals (8-connectivity only), rings, U shapes
+    height, width = int(rng.integers(1, 120)), int(rng.integers(1, 120))
+    img = (rng.random((height, width)) < rng.uniform(0, 0.6)).astype(np.uint8) * int(rng.integers(128, 256))
+    for _ in range(int(rng.integers(0, 6))):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        shape = rng.integers(0, 3)
+        if shape == 0:
+            cv2.line(img, (x, y), (x + int(rng.integers(-60, 60)), y + int(rng.integers(-60, 60))), 255, 1)
+        elif shape == 1:
+            cv2.circle(img, (x, y), int(rng.integers(1, 40)), 255, int(rng.integers(1, 3)))
+        else:
+            cv2.rectangle(img, (x, y), (x + int(rng.integers(1, 40)), y + int(rng.integers(1, 40))), 255, 1)
+            cv2.line(img, (x, y), (x + int(rng.integers(1, 40)), y), 0, 1)
+    # Grey levels around the threshold
+    img[rng.random(img.shape) < 0.05] = img_process.ANALYSIS_THRESHOLD
+    img[rng.random(img.shape) < 0.05] = img_process.ANALYSIS_THRESHOLD + 1
+    return img
+
+def test_tiled_matches_full():
+    rng = np.random.default_rng(0)
+    folder = tempfile.mkdtemp(prefix="tiled-analysis-")
+    try:
+        file = os.path.join(folder, "SEC_0001.png")
+        for i in range(200):
+            img = create_image(rng)
+            cv2.imwrite(file, img)
+            height, width = img.shape
+            expected = img_process.analyze_dlp_slice_image(file)
+            # Budgets giving 1, 2, 3, 7 rows per strip and half the image
+            for rows in sorted({1, 2, 3, 7, max(1, height // 2)}):
+                if rows >= height: continue
+                budget = width * height + rows * width * 4
+                assert img_process.get_strip_rows(width, height, budget) == rows
+                result = img_process.analyze_dlp_slice_image(file, memory_budget=budget)
+                assert result == expected, (i, rows, img.shape)
+                assert img_process.to_json_result(img_process.analyze_binary_image_tiled(img.copy(), budget, as_array=True)) == expected
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    test_tiled_matches_full()
+    print("OK")
@@ -0,0 +1,71 @@
+import os, sys, shutil, tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import timelapse
+
+def save_frames(folder, writer, start, count):
+    # Frames named like CamManager.save_image, fed to the writer as they are saved
+    for i in range(start, start + count):
+        frame = np.full((120, 160, 3), i % 255, np.uint8)
+        name = f"cam-{1700000000 + i}.webp"
+        cv2.imwrite(os.path.join(folder, name), frame)
+        writer.add_frame(frame, name)
+
+def get_frame_count(file):
+    capture = cv2.VideoCapture(file)
+    count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return count
+
+def test_pause_resume_finish():
+    # PRINTING -> PRINTING_PAUSE -> PRINTING -> PRINTING_FINISH: one video with every frame
+    folder = tempfile.mkdtemp(prefix="timelapse-")
+    try:
+        writer = timelapse.get_writer(folder, segment_frames=5)
+        save_frames(folder, writer, 0, 7)
+        save_frames(folder, writer, 7, 6)
+        output = writer.finish(os.path.join(folder, "print.mp4"))
+        assert get_frame_count(output) == 13
+    finally:
+        timelapse.release_writer(folder)
+        shutil.rmtree(folder)
+
+def test_frames_after_finish():
+    # A finished timelapse that gets more frames is reopened, not silently cut short
+    folder = tempfile.mkdtemp(prefix="timelapse-")
+    try:
+        writer = timelapse.get_writer(folder, segment_frames=5)
+        save_frames(folder, writer, 0, 7)
+        output = writer.finish(os.path.join(folder, "print.mp4"))
+        assert get_frame_count(output) == 7
+        save_frames(folder, writer, 7, 6)
+        output = writer.finish(os.path.join(folder, "print.mp4"))
+        assert get_frame_count(output) == 13
+        assert writer.finish(os.path.join(folder, "print.mp4")) == output
+    finally:
+        timelapse.release_writer(folder)
+        shutil.rmtree(folder)
+
+def test_restart_recovery():
+    folder = tempfile.mkdtemp(prefix="timelapse-")
+    try:
+        writer = timelapse.get_writer(folder, segment_frames=5)
+        save_frames(folder, writer, 0, 12)
+        # Client stops with a segment open: drop the writer without closing it
+        writer.video.release()
+        timelapse.WRITERS.clear()
+        for i in range(12, 15):
+            cv2.imwrite(os.path.join(folder, f"cam-{1700000000 + i}.webp"), np.zeros((120, 160, 3), np.uint8))
+        output = timelapse.get_writer(folder, segment_frames=5).finish(os.path.join(folder, "print.mp4"))
+        assert get_frame_count(output) == 15
+    finally:
+        timelapse.release_writer(folder)
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    test_pause_resume_finish()
+    test_frames_after_finish()
+    test_restart_recovery()
+    print("OK")